@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+CATEGORIES = ['Upper', 'Lower', 'Power', 'Core']
+
+def _load_kg(df):
+    """kg換算できる負荷（体重は解決済み、%はNaN）"""
+    return df['負荷_数値'].where(df['負荷_単位'] != '%')
+
+def estimated_1rm(df, max_reps=12):
+    """(名前, エクササイズ名) ごとの推定1RMの最高値（Epley式: 負荷×(1+回数/30)、1回なら負荷そのもの）
+
+    kg換算できる負荷で、回数が1〜max_repsのセットだけを使う。
+    列: 名前, エクササイズ名, e1rm, 日付, 負荷_kg, 回数
+    """
+    columns = ['名前', 'エクササイズ名', 'e1rm', '日付', '負荷_kg', '回数']
+    if len(df) == 0:
+        return pd.DataFrame(columns=columns)
+    load = _load_kg(df).to_numpy(dtype='float64')
+    reps = df['回数'].to_numpy(dtype='float64', na_value=np.nan)
+    valid = (load > 0) & (reps >= 1) & (reps <= max_reps)
+    e1rm = np.where(reps == 1, load, load * (1 + reps / 30))
+    sets = df.loc[valid, ['名前', 'エクササイズ名', '日付']].assign(e1rm=e1rm[valid], 負荷_kg=load[valid], 回数=reps[valid])
+    if len(sets) == 0:
+        return pd.DataFrame(columns=columns)
+    best = sets.loc[sets.groupby(['名前', 'エクササイズ名'], sort=False, observed=True)['e1rm'].idxmax()]
+    return best[columns].sort_values(['名前', 'エクササイズ名']).reset_index(drop=True)
+
+def _dated_volume(df):
+    # 総負荷量はfloat32で持っているので、合計はfloat64で取る
+    dated = df[df['日付'].notna() & df['総負荷量'].notna()]
+    return dated.assign(総負荷量=dated['総負荷量'].astype('float64'))
+
+def weekly_volume(df, categories=CATEGORIES):
+    """選手×週（月曜始まり）のCategory別総負荷量
+
+    index: (名前, 週), 列: categoriesと'合計'（categories以外のCategoryも合計には含む）
+    """
+    dated = _dated_volume(df)
+    if len(dated) == 0:
+        return pd.DataFrame(columns=list(categories) + ['合計'])
+    weeks = dated['日付'].dt.to_period('W-SUN').dt.start_time.rename('週')
+    volume = dated.pivot_table(index=[dated['名前'], weeks], columns='Category', values='総負荷量', aggfunc='sum', fill_value=0, observed=True)
+    total = volume.sum(axis=1)
+    volume = volume.reindex(columns=list(categories), fill_value=0)
+    volume['合計'] = total
+    volume.columns.name = None
+    return volume
+
+def daily_load(df, until=None):
+    """日付×選手の日別総負荷量（記録の無い日は0、untilまで延長）"""
+    dated = _dated_volume(df)
+    if len(dated) == 0:
+        return pd.DataFrame()
+    daily = dated.pivot_table(index=dated['日付'].dt.normalize(), columns='名前', values='総負荷量', aggfunc='sum', fill_value=0, observed=True)
+    end = max(daily.index.max(), pd.Timestamp(until).normalize()) if until is not None else daily.index.max()
+    return daily.reindex(pd.date_range(daily.index.min(), end, freq='D', name='日付'), fill_value=0)
+
+def acute_chronic_ratio(daily, acute_days=7, chronic_days=28):
+    """全選手分のACWRを一度に計算する
+
+    acute: 直近acute_days日の合計、chronic: 直近chronic_days日の合計をacute_days日あたりに
+    換算した値（データがchronic_days日に満たない間はNaN）。ratio = acute / chronic。
+    いずれも日付×選手のDataFrameの辞書で返す。
+    """
+    acute = daily.rolling(acute_days, min_periods=1).sum()
+    chronic = daily.rolling(chronic_days, min_periods=chronic_days).sum() * (acute_days / chronic_days)
+    return {'acute': acute, 'chronic': chronic, 'ratio': acute / chronic.where(chronic > 0)}
+
+def build_analytics(df, until=None, acute_days=7, chronic_days=28):
+    """分析ページ用の結果をまとめて作る（全選手分を列ごとの一括計算で求める）"""
+    if len(df) == 0:
+        return {'e1rm': estimated_1rm(df), 'weekly_volume': weekly_volume(df), 'acwr': pd.DataFrame(), 'acwr_latest': pd.DataFrame(), 'player_programs': {}}
+    daily = daily_load(df, until)
+    acwr = acute_chronic_ratio(daily, acute_days, chronic_days)
+    latest = pd.DataFrame({
+        '直近': acwr['acute'].iloc[-1],
+        '慢性（週平均）': acwr['chronic'].iloc[-1],
+        'ACWR': acwr['ratio'].iloc[-1],
+    }) if len(daily) > 0 else pd.DataFrame()
+    player_programs = df.groupby('名前', sort=False, observed=True)['プログラム名'].unique() if 'プログラム名' in df.columns else pd.Series(dtype=object)
+    return {
+        'e1rm': estimated_1rm(df),
+        'weekly_volume': weekly_volume(df),
+        'acwr': acwr['ratio'],
+        'acwr_latest': latest,
+        'player_programs': {name: set(programs) for name, programs in player_programs.items()},
+    }
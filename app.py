@@ -1,8 +1,22 @@
 import streamlit as st
 import pandas as pd
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from pathlib import Path
+from analytics import CATEGORIES, build_analytics
+from background_refresh import StaleWhileRevalidate
+from bulk_entry import build_entry_grid, grid_log_rows, latest_body_weights, validate_entry_grid
+from export import EXPORT_FORMATS, ExportCache
+from partitions import PartitionedTrainingLog, get_partition_worksheet, months_before, route_row
+from programs import ProgramCatalog, ProgramsSource, compile_programs
+from perf_trace import PerfRecorder, span
+from reports import ReportCache
+from snapshot import SnapshotStore
+from sheets_client import SheetsGovernor, SheetsHandlePool, governed, is_connection_error
+from training_log import LogAggregates, make_log_rows, memory_report
+from write_queue import TrainingLogWriter
 
 st.set_page_config(page_title="バスケットボール トレーニングシステム", layout="wide")
 
@@ -38,171 +52,391 @@ def restore_session_from_url():
 # 最初にセッション復元を試みる
 restore_session_from_url()
 
+# 再実行ごとの処理時間の計測（診断ツールとJSONログに出す）
+@st.cache_resource
+def get_perf_recorder():
+    return PerfRecorder()
+
+def get_perf_session_id():
+    if 'perf_session_id' not in st.session_state:
+        st.session_state.perf_session_id = uuid.uuid4().hex[:8]
+    return st.session_state.perf_session_id
+
+perf_trace = get_perf_recorder().begin(get_perf_session_id())
+PERF_SPANS = ['sheet_fetch', 'parse', 'program_grouping', 'history_lookup', 'save', 'render']
+
+# Sheets APIのクォータ管理（全セッション共通）
+@st.cache_resource
+def get_sheets_governor():
+    return SheetsGovernor(reads_per_minute=60, writes_per_minute=60)
+
 # Google Sheets認証
+# gspread・oauth2clientは読み込みに時間がかかるので、ここで初めて読む（最初の表示を待たせない）
 @st.cache_resource
 def get_gsheet_client():
     try:
+        fake_sheets = st.secrets.get("fake_sheets")
+        if fake_sheets:
+            # 認証なしの合成データ（ベンチマーク・動作確認用）
+            from fake_sheets import synthetic_client
+            return governed(synthetic_client(**dict(fake_sheets)), get_sheets_governor())
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
         credentials_dict = dict(st.secrets["gcp_service_account"])
         scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
         credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
         client = gspread.authorize(credentials)
-        return client
+        return governed(client, get_sheets_governor())
     except Exception as e:
         st.sidebar.error(f"Google Sheets認証エラー: {str(e)[:50]}")
         return None
 
+# SpreadsheetとWorksheetのハンドルを全セッションで共有
+@st.cache_resource
+def get_sheets_pool():
+    try:
+        spreadsheet_url = st.secrets.get("spreadsheet_url", "")
+    except Exception:
+        spreadsheet_url = ""
+    return SheetsHandlePool(get_gsheet_client, spreadsheet_url, on_reconnect=get_gsheet_client.clear)
+
 def get_spreadsheet():
     client = get_gsheet_client()
     if client is None:
         return None, None
     try:
-        spreadsheet_url = st.secrets["spreadsheet_url"]
-        spreadsheet = client.open_by_url(spreadsheet_url)
+        spreadsheet = get_sheets_pool().spreadsheet()
         return spreadsheet, client
     except Exception as e:
+        if is_connection_error(e):
+            get_sheets_pool().reconnect()
         st.sidebar.error(f"スプレッドシートオープンエラー: {str(e)[:50]}")
         return None, None
 
-# プログラムデータの読み込み
-@st.cache_data(ttl=60)
+# 最後に読み込めたProgramsとTrainingLogの保存先（再起動直後・障害中はここから表示する）
+@st.cache_resource
+def get_snapshot_store():
+    try:
+        snapshot_dir = st.secrets.get("snapshot_dir")
+    except Exception:
+        snapshot_dir = None
+    return SnapshotStore(snapshot_dir or Path(__file__).resolve().parent / ".snapshots")
+
+# Programsは版のセル（secretsのprograms_version_range）か更新時刻を確かめ、変わったときだけ全件読む
+# 更新時刻はTrainingLogへの保存でも変わるので、版のセルを設定しておくのが望ましい
+@st.cache_resource
+def get_programs_source():
+    try:
+        version_range = st.secrets.get("programs_version_range")
+    except Exception:
+        version_range = None
+    return ProgramsSource(get_sheets_pool(), version_range)
+
+# 期限切れでも前回のデータをすぐ返し、更新は裏で1本だけ行う
+# スナップショットがあればその内容で始め、最初の読み込みも裏で行う
+@st.cache_resource
+def get_programs_refresher():
+    source = get_programs_source()
+    governor = get_sheets_governor()
+    store = get_snapshot_store()
+    def load():
+        program_df, revision = source.load()
+        if len(program_df) > 0:
+            store.save("programs", program_df, version=revision)
+        return program_df, revision
+    snapshot = store.load("programs")
+    initial = ((snapshot[0], snapshot[1].get('version')), snapshot[1].get('saved_at', 0.0)) if snapshot is not None else None
+    return StaleWhileRevalidate(load, 60, name="programs", background_context=lambda: governor.priority('background'), initial=initial)
+
 def load_program_file():
-    spreadsheet, _ = get_spreadsheet()
-    if spreadsheet is None:
-        return pd.DataFrame()
+    if get_gsheet_client() is None:
+        # 認証できない間もスナップショットがあれば表示だけは続ける
+        loaded = get_programs_refresher().value
+        return loaded[0] if loaded is not None else pd.DataFrame()
+    preload_sheets()
     try:
-        worksheet = spreadsheet.worksheet("Programs")
-        data = worksheet.get_all_values()
-        if len(data) > 0:
-            df = pd.DataFrame(data[1:], columns=data[0])
-            if 'Type' not in df.columns:
-                df['Type'] = ''
-            if 'Category' not in df.columns:
-                df['Category'] = 'U18'
-            return df
-        else:
-            return pd.DataFrame()
+        program_df, _ = get_programs_refresher().get()
+        return program_df
     except Exception as e:
         st.sidebar.error(f"プログラムデータ読み込みエラー: {str(e)[:50]}")
         return pd.DataFrame()
 
-@st.cache_data(ttl=10)
-def load_training_log():
-    spreadsheet, _ = get_spreadsheet()
-    if spreadsheet is None:
-        return pd.DataFrame(columns=["日付", "プログラム名", "名前", "体重", "エクササイズ名", "Category", "set", "負荷", "回数", "総負荷量"])
+def load_programs_revision():
+    loaded = get_programs_refresher().value
+    return loaded[1] if loaded is not None else None
+
+# 入力ページ用のプログラムモデルはProgramsの版ごとに全プログラム分をまとめて作り、全セッションで共有
+# （再実行のたびにコピーしないよう読み取り専用で使う）
+@st.cache_resource(max_entries=4)
+def get_compiled_programs(revision):
+    return compile_programs(load_program_file())
+
+@span('program_grouping')
+def get_compiled_program(category, program):
+    return get_compiled_programs(load_programs_revision()).get((category, program), {'exercises': [], 'warmups': []})
+
+# プログラム一覧ページの索引もProgramsの版ごとに1つだけ作って全セッションで共有
+@st.cache_resource(max_entries=4)
+def get_program_catalog(revision):
+    return ProgramCatalog(load_program_file())
+
+PROGRAMS_PER_PAGE = 10
+
+# データ管理ページの集計は読み込み・追記のたびに足し込んでおく
+@st.cache_resource
+def get_log_aggregates():
+    return LogAggregates()
+
+# トレーニングログは月別シート（TrainingLog_YYYY_MM）を必要な月だけ読み、追記分だけを取り込む（全セッション共通）
+# 作成済みのリソース（サイドバーの診断が、まだ無いものを作らないように）
+@st.cache_resource
+def get_created_resources():
+    return {}
+
+@st.cache_resource
+def get_training_log_reader():
     try:
-        worksheet = spreadsheet.worksheet("TrainingLog")
-        data = worksheet.get_all_values()
-        if len(data) > 1:
-            # 1行目をヘッダーとして使用し、2行目以降をデータとして使用
-            df = pd.DataFrame(data[1:], columns=data[0])
-            
-            # 日付列を日付型に変換
-            if '日付' in df.columns:
-                df['日付'] = pd.to_datetime(df['日付'], errors='coerce')
-            
-            # 回数列を数値型に変換
-            if '回数' in df.columns:
-                df['回数'] = pd.to_numeric(df['回数'], errors='coerce')
-            
-            # 総負荷量列を数値型に変換
-            if '総負荷量' in df.columns:
-                df['総負荷量'] = pd.to_numeric(df['総負荷量'], errors='coerce')
-            
-            # set列を数値型に変換
-            if 'set' in df.columns:
-                df['set_数値'] = pd.to_numeric(df['set'], errors='coerce')
-            
-            # 負荷列の数値部分を抽出
-            if '負荷' in df.columns:
-                df['負荷_数値'] = pd.to_numeric(df['負荷'].str.replace('kg', '').str.replace('%', '').str.replace('体重', ''), errors='coerce')
-            
-            return df
-        else:
-            return pd.DataFrame(columns=["日付", "プログラム名", "名前", "体重", "エクササイズ名", "Category", "set", "負荷", "回数", "総負荷量"])
+        archive_dir = st.secrets.get("training_log_archive_dir")
+    except Exception:
+        archive_dir = None
+    reader = PartitionedTrainingLog(get_sheets_pool(), archive_dir or Path(__file__).resolve().parent / "training_log_archive")
+    reader.listeners.append(get_log_aggregates().on_log_change)
+    snapshot = get_snapshot_store().load("training_log")
+    if snapshot is not None:
+        snapshot_df, meta = snapshot
+        reader.seed(snapshot_df, tuple(meta['since']) if meta.get('since') else None)
+        get_log_aggregates().on_log_change('reset', snapshot_df)
+    get_created_resources()['training_log_reader'] = reader
+    return reader
+
+# スナップショットの保存は多くても1分に1回
+LOG_SNAPSHOT_INTERVAL = 60
+
+@st.cache_resource
+def get_log_refresher():
+    reader = get_training_log_reader()
+    governor = get_sheets_governor()
+    store = get_snapshot_store()
+    def refresh():
+        df = reader.refresh()
+        if not reader.seeded:
+            store.save("training_log", df, version=reader.revision, min_interval=LOG_SNAPSHOT_INTERVAL, since=reader.scope())
+        return df
+    meta = store.meta("training_log") if reader.seeded else None
+    return StaleWhileRevalidate(
+        refresh, 10,
+        is_stale=lambda: not reader.is_fresh(10), name="training-log",
+        background_context=lambda: governor.priority('background'),
+        initial=(None, meta.get('saved_at', 0.0)) if meta else None,
+    )
+
+# 入力ページ（前回記録）で読むのは直近の月だけ
+RECENT_LOG_MONTHS = 6
+
+# 起動後の最初の表示では、Programsと直近の月のTrainingLogを1回のvalues_batch_getでまとめて読む
+# Programsの変更確認（更新時刻）はその間に別スレッドで済ませ、両方のキャッシュを同時に埋める
+# スナップショットで始めた場合は読み込みを裏で行うので何もしない
+@st.cache_resource
+def preload_sheets():
+    reader = get_training_log_reader()
+    if get_gsheet_client() is None or reader.seeded:
+        return False
+    source = get_programs_source()
+    pool = get_sheets_pool()
+    fetched = {}
+    def fetch_values(titles):
+        with span('sheet_fetch'):
+            fetched.update(pool.batch_values(["Programs"] + titles))
+        return {title: fetched[title] for title in titles if title in fetched}
+    try:
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="programs-check") as executor:
+            marker = executor.submit(source.marker)
+            reader.preload(months_before(datetime.today().date(), RECENT_LOG_MONTHS), fetch_values)
+            program_df, revision = source.preload(fetched.get("Programs", []), marker.result() if marker.exception() is None else None)
+    except Exception:
+        # 読めなかった分はそれぞれの通常の読み込みに任せる
+        return False
+    store = get_snapshot_store()
+    if len(program_df) > 0:
+        store.save("programs", program_df, version=revision)
+    store.save("training_log", reader.df, version=reader.revision, since=reader.scope())
+    get_programs_refresher().prime((program_df, revision))
+    get_log_refresher().prime(reader.df)
+    return True
+
+def load_training_log(months=None):
+    """直近months か月分（Noneなら全期間）を読み込んだログを返す"""
+    reader = get_training_log_reader()
+    if get_gsheet_client() is None:
+        return reader.df
+    since = months_before(datetime.today().date(), months) if months else None
+    preload_sheets()
+    try:
+        if not (reader.seeded and reader.covers(since)):
+            reader.require(since)
+        # スナップショットを返している間は、シートの読み込みを裏で進める
+        get_log_refresher().get()
     except Exception as e:
         st.sidebar.error(f"トレーニングログ読み込みエラー: {str(e)[:50]}")
-        return pd.DataFrame(columns=["日付", "プログラム名", "名前", "体重", "エクササイズ名", "Category", "set", "負荷", "回数", "総負荷量"])
+    return reader.df
 
-def get_exercise_history(df, player_name, exercise_name, limit=5):
-    if len(df) == 0 or not player_name or not exercise_name:
-        return pd.DataFrame()
-    filtered_df = df[(df['名前'] == player_name) & (df['エクササイズ名'] == exercise_name)].copy()
-    if len(filtered_df) == 0:
-        return pd.DataFrame()
-    if '日付' in filtered_df.columns:
-        filtered_df = filtered_df.sort_values('日付', ascending=False)
-    return filtered_df.head(limit * 10)  # 十分な数を取得
+# 全セッションの保存をまとめて送る書き込みスレッド（未送信行はSQLiteに保持）
+# 行は日付の月のシートに振り分け、シートが無ければ作る
+@st.cache_resource
+def get_training_log_writer():
+    pool = get_sheets_pool()
+    reader = get_training_log_reader()
+    def on_error(error):
+        if is_connection_error(error):
+            pool.reconnect()
+    writer = TrainingLogWriter(
+        str(Path(__file__).resolve().parent / ".training_log_spool.sqlite3"),
+        lambda title: get_partition_worksheet(pool, title),
+        route=route_row,
+        on_written=reader.merge_written,
+        on_error=on_error,
+    )
+    return writer.start()
 
-def get_exercise_stats(history_df):
-    if len(history_df) == 0:
-        return None
-    latest = history_df.iloc[0]
-    stats = {
-        'latest_date': latest.get('日付'),
-        'latest_load': latest.get('負荷'),
-        'latest_reps': latest.get('回数'),
-        'latest_total_load': latest.get('総負荷量', 0),
-        'avg_reps': history_df['回数'].mean() if '回数' in history_df.columns else 0,
-        'max_load': history_df['総負荷量'].max() if '総負荷量' in history_df.columns else 0,
-        'total_sessions': len(history_df['日付'].dt.date.unique()) if '日付' in history_df.columns else len(history_df),
-        'total_sets': len(history_df)
-    }
-    return stats
+def is_read_only():
+    """シートを読めずスナップショットを表示している間は保存しない"""
+    return get_gsheet_client() is None or get_training_log_reader().seeded
+
+def get_writer_session_id():
+    if 'writer_session_id' not in st.session_state:
+        st.session_state.writer_session_id = uuid.uuid4().hex
+    return st.session_state.writer_session_id
+
+# チーム分析は直近ANALYTICS_WEEKS週（週間総負荷量の表示期間、ACWRの28日を含む）だけを使う
+ANALYTICS_WEEKS = 12
+
+def analytics_window(today):
+    """チーム分析の最初の日（ANALYTICS_WEEKS週前の週の月曜）と、読み込む月数"""
+    start = pd.Timestamp(today).normalize() - pd.Timedelta(days=today.weekday(), weeks=ANALYTICS_WEEKS - 1)
+    return start, (today.year - start.year) * 12 + today.month - start.month + 1
+
+# チーム分析は全選手分をまとめて計算し、ログの版（と日付）ごとに使い回す
+@st.cache_data(max_entries=2, show_spinner="分析中...")
+def get_training_analytics(revision, today):
+    start, months = analytics_window(today)
+    # 他のページで古い月も読み込み済みのことがあるので、期間で絞ってから計算する
+    log_df = load_training_log(months)
+    return build_analytics(log_df[log_df['日付'] >= start], until=today)
 
+def team_roster(player_programs, team):
+    """チームの選手（そのTypeのプログラムを実施したことがある選手）"""
+    # ログのCategoryはエクササイズの部位なので、チームは実施したプログラムで判定する
+    team_programs = set(get_program_catalog(load_programs_revision()).programs(team))
+    return sorted(name for name, programs in player_programs.items() if programs & team_programs)
+
+def acwr_status(ratio):
+    if pd.isna(ratio):
+        return "―"
+    if ratio > 1.5:
+        return "🔴 高負荷"
+    if ratio > 1.3 or ratio < 0.8:
+        return "🟡 注意"
+    return "🟢 適正"
+
+@span('save')
 def save_training_log_formatted(player_name, program_name, exercise_name, exercise_category, sets_data, body_weight=None, date=None):
     if date is None:
         date = datetime.today().date()
-    spreadsheet, _ = get_spreadsheet()
-    if spreadsheet is None:
-        st.error("Google Sheetsに接続できません")
-        return 0
-    try:
-        worksheet = spreadsheet.worksheet("TrainingLog")
-    except:
-        try:
-            worksheet = spreadsheet.add_worksheet(title="TrainingLog", rows="1000", cols="10")
-            # 正しい列名でヘッダーを設定
-            worksheet.append_row(["日付", "プログラム名", "名前", "体重", "エクササイズ名", "Category", "set", "負荷", "回数", "総負荷量"])
-        except:
-            st.error("シートの作成に失敗しました")
-            return 0
-    
-    new_rows = []
-    for set_data in sets_data:
-        load_value = set_data['load']
-        reps = set_data['reps']
-        load_numeric = 0
-        if isinstance(load_value, str):
-            if 'kg' in load_value:
-                try:
-                    load_numeric = float(load_value.replace('kg', ''))
-                except:
-                    load_numeric = 0
-            elif load_value == "体重":
-                load_numeric = body_weight if body_weight else 0
-            else:
-                try:
-                    load_numeric = float(load_value)
-                except:
-                    load_numeric = 0
-        else:
-            try:
-                load_numeric = float(load_value)
-            except:
-                load_numeric = 0
-        total_load = load_numeric * reps
-        # A列から: 日付、プログラム名、名前、体重、エクササイズ名、Category、set、負荷、回数、総負荷量
-        new_row = [str(date), program_name, player_name, str(body_weight) if body_weight else '', exercise_name, exercise_category, str(set_data['set_number']), str(load_value), str(reps), str(total_load)]
-        new_rows.append(new_row)
+    # A列から: 日付、プログラム名、名前、体重、エクササイズ名、Category、set、負荷、回数、総負荷量
+    new_rows = make_log_rows(
+        date, program_name, [player_name] * len(sets_data), [body_weight] * len(sets_data),
+        [exercise_name] * len(sets_data), [exercise_category] * len(sets_data),
+        [set_data['set_number'] for set_data in sets_data], [set_data['load'] for set_data in sets_data], [set_data['reps'] for set_data in sets_data],
+    )
     try:
-        worksheet.append_rows(new_rows)
-        st.cache_data.clear()
-        return len(new_rows)
+        # 書き込みはバックグラウンドのライターに任せ、スプールに積んだらすぐ戻る
+        return get_training_log_writer().submit(get_writer_session_id(), new_rows)
     except Exception as e:
         st.error(f"保存エラー: {str(e)[:50]}")
         return 0
 
+@span('history_lookup')
+def get_latest_session(player_name, exercise_name):
+    """前回のトレーニング概要（(名前, エクササイズ名) の索引から）"""
+    return get_training_log_reader().latest_session(player_name, exercise_name)
+
+def get_log_metrics():
+    """データ管理ページの統計（集計済みの値を返すだけ）"""
+    return get_log_aggregates().metrics()
+
+# エクスポートのファイルは押されたときに作り、(条件, データの版) ごとに使い回す
+@st.cache_resource
+def get_export_cache():
+    return ExportCache()
+
+def render_export_controls(log_df, metrics, revision):
+    """期間・選手・Type・プログラムで絞り込んだログのダウンロード"""
+    day_counts = metrics['day_counts']
+    first_date = day_counts.index.min().date() if len(day_counts) > 0 else datetime.today().date()
+    last_date = day_counts.index.max().date() if len(day_counts) > 0 else datetime.today().date()
+    col1, col2 = st.columns(2)
+    with col1:
+        date_range = st.date_input("期間", value=(first_date, last_date), min_value=first_date, max_value=last_date, key="export_dates")
+        players = st.multiselect("選手", list(metrics['player_counts'].index), key="export_players", placeholder="すべて")
+    with col2:
+        types = st.multiselect("Type", list(metrics['category_counts'].index), key="export_types", placeholder="すべて")
+        programs = st.multiselect("プログラム", list(metrics['program_counts'].index), key="export_programs", placeholder="すべて")
+    fmt = st.radio("形式", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+    filters = {
+        'start_date': date_range[0] if len(date_range) > 0 else None,
+        'end_date': date_range[1] if len(date_range) > 1 else None,
+        'players': sorted(players),
+        'types': sorted(types),
+        'programs': sorted(programs),
+    }
+    cache = get_export_cache()
+    extension, mime = EXPORT_FORMATS[fmt]
+    st.download_button(
+        f"📥 トレーニングログを{fmt}でダウンロード",
+        lambda: cache.get(log_df, filters, revision, fmt).read_bytes(),
+        f"training_log_{datetime.today().strftime('%Y%m%d')}.{extension}",
+        mime,
+        on_click="ignore",
+    )
+
+# PDFレポートも押されたときに作り、(選手, 期間, データの版) ごとに使い回す
+@st.cache_resource
+def get_report_cache():
+    return ReportCache()
+
+def render_report_controls(log_df, metrics, revision):
+    """選手ごと・チームごとのPDFトレーニングレポート（セッション数・Category別総負荷量・直近の負荷）"""
+    day_counts = metrics['day_counts']
+    last_date = day_counts.index.max().date() if len(day_counts) > 0 else datetime.today().date()
+    first_date = day_counts.index.min().date() if len(day_counts) > 0 else last_date
+    col1, col2 = st.columns(2)
+    with col1:
+        teams = ['U18', 'U15', 'Personal']
+        team = st.selectbox("チーム", teams, index=teams.index(st.session_state.selected_type), key="report_team")
+    with col2:
+        date_range = st.date_input("期間", value=(max(first_date, last_date - timedelta(days=27)), last_date), min_value=first_date, max_value=last_date, key="report_dates")
+    # 選手ごとの実施プログラムは集計済みの値を使う（ログの行数によらずすぐ出る）
+    roster = team_roster(metrics['player_programs'], team)
+    if not roster:
+        st.info(f"{team}の選手の記録がありません")
+        return
+    target = st.selectbox("対象", ["チーム全体"] + roster, key="report_target")
+    period = (date_range[0] if len(date_range) > 0 else None, date_range[1] if len(date_range) > 1 else None)
+    cache = get_report_cache()
+    today = datetime.today().strftime('%Y%m%d')
+    if target == "チーム全体":
+        data = lambda: cache.team_report(log_df, team, roster, period, revision).read_bytes()
+    else:
+        data = lambda: cache.athlete_reports(log_df, [target], period, revision)[target].read_bytes()
+    st.download_button(f"📄 {target}のレポート（PDF）", data, f"report_{team}_{target}_{today}.pdf", "application/pdf", on_click="ignore")
+    st.download_button(
+        f"📦 {team}の全員分（{len(roster)}名）のレポートをZIPでダウンロード",
+        lambda: cache.roster_archive(log_df, team, roster, period, revision).read_bytes(),
+        f"report_{team}_{today}.zip",
+        "application/zip",
+        on_click="ignore",
+    )
+
 def get_category_display(category):
     if not category or category == '' or pd.isna(category):
         return ""
@@ -219,6 +453,268 @@ def get_category_display(category):
     else:
         return f'<span style="color: #7f8c8d;">{category}</span>'
 
+def apply_first_set_to_all(idx, actual_sets):
+    """1セット目の単位・負荷・レップ数を2セット目以降に写す"""
+    set1_unit = st.session_state.get(f"unit_{idx}_0", "kg")
+    set1_rep = st.session_state.get(f"rep_{idx}_0", 1)
+    for set_num in range(1, actual_sets):
+        st.session_state[f"unit_{idx}_{set_num}"] = set1_unit
+        st.session_state[f"rep_{idx}_{set_num}"] = set1_rep
+        if set1_unit == "その他":
+            st.session_state[f"load_{idx}_{set_num}"] = st.session_state.get(f"load_{idx}_0", "")
+        elif set1_unit != "体重":
+            st.session_state[f"load_val_{idx}_{set_num}"] = st.session_state.get(f"load_val_{idx}_0", 0.0)
+
+# セット入力は種目ごとのフラグメントにして、入力のたびにその種目の部分だけ再実行する
+@st.fragment
+def render_set_entry(idx, exercise, player_name, body_weight, selected_program):
+    with get_perf_recorder().fragment_rerun(get_perf_session_id(), "Training Log 入力（セット入力）"):
+        exercise_title = f"{exercise.get('No', '')} {exercise['Exercise']}"
+        with st.expander(f"記録入力: {exercise_title}", expanded=True):
+            if exercise.get('Type') and exercise['Type'] != '':
+                st.markdown(f"""<div style="background: linear-gradient(135deg, rgba(108, 117, 125, 0.1) 0%, rgba(73, 80, 87, 0.1) 100%); border-left: 4px solid #6c757d; padding: 8px 12px; margin: 8px 0; border-radius: 6px; text-align: center;"><div style="color: #495057; font-weight: 600; font-size: 14px;">Type: {get_category_display(exercise['Type'])}</div></div>""", unsafe_allow_html=True)
+
+            # ★★★ 前回の記録表示 ★★★
+            load_training_log(RECENT_LOG_MONTHS)
+
+            if player_name:
+                # (名前, エクササイズ名) の索引から最新セッションを取得
+                latest_session = get_latest_session(player_name, exercise['Exercise'])
+
+                if latest_session is not None:
+                    latest_date_str = latest_session['date'].strftime('%m/%d')
+                    last_set_num = latest_session['set'] if pd.notna(latest_session['set']) else '-'
+                    last_load = latest_session['load'] if pd.notna(latest_session['load']) and str(latest_session['load']).strip() != '' else '-'
+                    last_reps = int(latest_session['reps']) if pd.notna(latest_session['reps']) else '-'
+                    last_total = float(latest_session['total_load']) if pd.notna(latest_session['total_load']) else '-'
+                    total_sets = latest_session['total_sets']
+
+                    st.markdown(f"""
+                    <div style="background: linear-gradient(135deg, rgba(25, 118, 210, 0.1) 0%, rgba(21, 101, 192, 0.1) 100%); 
+                         border: 2px solid rgba(25, 118, 210, 0.3); border-radius: 12px; padding: 16px; margin: 12px 0;">
+                        <h5 style="color: #1976d2; margin: 0 0 12px 0; font-size: 16px; font-weight: 700;">
+                            📈 前回のトレーニング ({latest_date_str})
+                        </h5>
+                        <div style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 12px; margin-top: 12px;">
+                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">総セット数</div>
+                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">{total_sets}セット</div>
+                            </div>
+                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">最終セット</div>
+                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">SET {last_set_num}</div>
+                            </div>
+                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">重量</div>
+                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">{last_load}</div>
+                            </div>
+                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">レップ数</div>
+                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">{last_reps}回</div>
+                            </div>
+                        </div>
+                        <div style="background: rgba(25, 118, 210, 0.1); padding: 8px; border-radius: 6px; margin-top: 12px; text-align: center;">
+                            <div style="color: #1976d2; font-size: 13px; font-weight: 600;">
+                                最終セット総負荷量: {last_total} kg
+                            </div>
+                        </div>
+                    </div>
+                    """, unsafe_allow_html=True)
+                else:
+                    st.markdown("""<div style="background: linear-gradient(135deg, rgba(96, 125, 139, 0.1) 0%, rgba(120, 144, 156, 0.1) 100%); border: 2px dashed rgba(96, 125, 139, 0.3); border-radius: 8px; padding: 16px; margin: 12px 0; text-align: center;"><div style="color: #607d8b; font-size: 16px; font-weight: 600;">🌟 初回トレーニング</div></div>""", unsafe_allow_html=True)
+            elif not player_name:
+                st.markdown("""<div style="background: rgba(255, 193, 7, 0.1); border: 2px solid rgba(255, 193, 7, 0.3); border-radius: 8px; padding: 12px; margin: 12px 0; text-align: center;"><div style="color: #f57c00; font-size: 14px; font-weight: 600;">⚠️ 選手名を入力すると前回のデータが表示されます</div></div>""", unsafe_allow_html=True)
+
+            if 'Point' in exercise and exercise['Point'] and pd.notna(exercise['Point']) and exercise['Point'] != '':
+                st.markdown(f"""<div style="background: linear-gradient(135deg, rgba(108, 117, 125, 0.1) 0%, rgba(73, 80, 87, 0.1) 100%); border-left: 4px solid #6c757d; padding: 10px 15px; margin: 10px 0 15px 0; border-radius: 6px;"><p style="margin: 0; color: #495057; font-weight: 600; font-size: 13px;"><span style="color: #6c757d; font-weight: 700;">POINT:</span> {exercise['Point']}</p></div>""", unsafe_allow_html=True)
+
+            actual_sets = st.number_input("実施セット数", min_value=1, value=exercise['set_total'], key=f"sets_{idx}", help=f"予定: {exercise['set']}")
+
+            st.markdown("**記録入力:**")
+
+            loads = []
+            reps = []
+
+            for set_num in range(actual_sets):
+                st.markdown(f"""<div style="background: linear-gradient(135deg, rgba(52, 73, 94, 0.1) 0%, rgba(44, 62, 80, 0.1) 100%); border-left: 3px solid #34495e; padding: 6px 10px; margin: 8px 0 4px 0; border-radius: 4px;"><span style="color: #2c3e50; font-weight: 600; font-size: 13px;">SET {set_num + 1}</span></div>""", unsafe_allow_html=True)
+
+                col1, col2, col3, col4 = st.columns([1, 1, 1, 0.7])
+
+                with col1:
+                    unit = st.selectbox(
+                        "単位",
+                        ["kg", "%", "体重", "その他"],
+                        key=f"unit_{idx}_{set_num}",
+                        label_visibility="collapsed"
+                    )
+
+                with col2:
+                    if unit == "その他":
+                        set_load = st.text_input(
+                            "負荷",
+                            key=f"load_{idx}_{set_num}",
+                            placeholder="負荷",
+                            label_visibility="collapsed"
+                        )
+                    elif unit == "体重":
+                        set_load = "体重"
+                        st.text_input("負荷", value="体重", disabled=True, key=f"load_disabled_{idx}_{set_num}", label_visibility="collapsed")
+                    else:
+                        load_value = st.number_input(
+                            "値",
+                            min_value=0.0,
+                            step=0.1 if unit == "%" else 0.5,
+                            key=f"load_val_{idx}_{set_num}",
+                            label_visibility="collapsed"
+                        )
+                        set_load = f"{load_value}{unit}"
+
+                    loads.append(set_load)
+
+                with col3:
+                    set_rep = st.number_input(
+                        "レップ数",
+                        min_value=0,
+                        key=f"rep_{idx}_{set_num}",
+                        label_visibility="collapsed"
+                    )
+                    reps.append(set_rep)
+
+                with col4:
+                    if set_num == 0 and actual_sets > 1:
+                        if st.button("全適用", key=f"copy_all_{idx}", help="この設定を全セットに適用"):
+                            # 2セット目以降のウィジェットはまだ作られていないので、そのまま値を入れられる
+                            apply_first_set_to_all(idx, actual_sets)
+                            st.toast("✅ 全セットに適用しました")
+                    else:
+                        st.write("")
+
+            col_btn1, col_btn2 = st.columns(2)
+            with col_btn1:
+                read_only = is_read_only()
+                if st.button(f"{exercise['Exercise']} 完了", key=f"complete_{idx}", type="primary", use_container_width=True, disabled=read_only, help="最新のデータを読み込むまで保存できません" if read_only else None):
+                    if not player_name:
+                        st.error("選手名を入力してください")
+                    else:
+                        try:
+                            sets_data = []
+                            for set_num in range(actual_sets):
+                                sets_data.append({'set_number': set_num + 1, 'load': loads[set_num], 'reps': reps[set_num]})
+                            exercise_type = exercise.get('Type', '')
+                            with st.spinner('保存中...'):
+                                saved_sets = save_training_log_formatted(
+                                    player_name=player_name, 
+                                    program_name=selected_program, 
+                                    exercise_name=exercise['Exercise'], 
+                                    exercise_category=exercise_type, 
+                                    sets_data=sets_data, 
+                                    body_weight=body_weight
+                                )
+                            if saved_sets > 0:
+                                # 状態をクリーンアップ
+                                st.session_state.selected_exercise_idx = None
+                                if "exercise" in st.query_params:
+                                    del st.query_params["exercise"]
+                                # 成功メッセージを表示してリロード
+                                st.success(f"✅ {exercise['Exercise']} 完了！{saved_sets}セットのデータを保存しました。")
+                                st.rerun()
+                            else:
+                                st.error("❌ データの保存に失敗しました")
+                        except Exception as e:
+                            st.error(f"❌ エラーが発生しました: {str(e)[:100]}")
+            with col_btn2:
+                if st.button("種目選択に戻る", key=f"back_{idx}", use_container_width=True):
+                    st.session_state.selected_exercise_idx = None
+                    if "exercise" in st.query_params:
+                        del st.query_params["exercise"]
+                    st.rerun()
+
+# コーチ一括入力も表の編集ではこの部分だけを再実行する
+@st.fragment
+def render_bulk_entry(category, program_name):
+    """選手×種目×セットの表をプログラムの予定で埋め、確認してから1回の書き込みでまとめて保存する"""
+    with get_perf_recorder().fragment_rerun(get_perf_session_id(), "Training Log 入力（一括入力）"):
+        if 'bulk_saved' in st.session_state:
+            st.success(st.session_state.pop('bulk_saved'))
+            st.session_state.bulk_players = []
+        exercises = get_compiled_program(category, program_name)['exercises']
+        log_df = load_training_log(RECENT_LOG_MONTHS)
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            players = st.multiselect("選手", sorted(get_log_metrics()['player_counts'].index), key="bulk_players", accept_new_options=True, placeholder="選択または名前を入力")
+        with col2:
+            entry_date = st.date_input("実施日", value=datetime.today().date(), key="bulk_date")
+        if not players or not exercises:
+            st.info("選手を選ぶと、プログラムの予定（セット・負荷・回数）で埋めた入力表が表示されます")
+            return
+
+        # 直近の体重はログの版と選手が変わったときだけ引き直す
+        weight_key = (tuple(players), get_training_log_reader().revision)
+        if st.session_state.get('bulk_weight_key') != weight_key:
+            st.session_state.bulk_weight_key = weight_key
+            st.session_state.bulk_known_weights = latest_body_weights(log_df, players)
+        known_weights = st.session_state.bulk_known_weights
+
+        # 選手やプログラムを変えたら編集内容もリセットする
+        grid_key = f"bulk_{abs(hash((category, program_name, tuple(players))))}"
+        st.markdown("**体重 (kg)**")
+        weights_df = st.data_editor(
+            pd.DataFrame({'選手': players, '体重': [known_weights.get(player) for player in players]}),
+            key=f"{grid_key}_weights", hide_index=True, disabled=['選手'], use_container_width=True,
+            column_config={'体重': st.column_config.NumberColumn(min_value=30.0, max_value=200.0, step=0.1, format="%.1f")},
+        )
+        st.markdown("**記録**（実施しなかったセットは行を削除、追加のセットは行を追加）")
+        grid = st.data_editor(
+            build_entry_grid(players, exercises),
+            key=f"{grid_key}_sets", hide_index=True, num_rows="dynamic", disabled=['No'], use_container_width=True,
+            column_config={
+                '選手': st.column_config.SelectboxColumn(options=players, required=True),
+                'エクササイズ名': st.column_config.SelectboxColumn(options=[exercise['Exercise'] for exercise in exercises], required=True),
+                'set': st.column_config.NumberColumn(min_value=1, step=1),
+                '負荷': st.column_config.TextColumn(help="60kg / 70% / 体重 / 体重+10kg"),
+                '回数': st.column_config.NumberColumn(min_value=0, step=1),
+            },
+        )
+        read_only = is_read_only()
+        if st.button(f"{len(grid)}セットをまとめて保存", key=f"{grid_key}_save", type="primary", use_container_width=True, disabled=read_only, help="最新のデータを読み込むまで保存できません" if read_only else None):
+            body_weights = {player: float(weight) for player, weight in zip(weights_df['選手'], weights_df['体重']) if pd.notna(weight)}
+            entries, errors = validate_entry_grid(grid, body_weights)
+            if errors:
+                more = f"\n- ほか{len(errors) - 20}件" if len(errors) > 20 else ""
+                st.error("保存できない行があります:\n" + "\n".join(f"- {error}" for error in errors[:20]) + more)
+            elif len(entries) == 0:
+                st.warning("保存する行がありません")
+            else:
+                rows = grid_log_rows(entries, program_name, entry_date, {exercise['Exercise']: exercise.get('Type', '') for exercise in exercises})
+                try:
+                    # 全員分を1回のsubmitで積み、書き込みスレッドが1回のappend_rowsで送る
+                    saved_sets = get_training_log_writer().submit(get_writer_session_id(), rows)
+                except Exception as e:
+                    st.error(f"保存エラー: {str(e)[:50]}")
+                else:
+                    st.session_state.bulk_saved = f"✅ {entries['選手'].nunique()}名・{saved_sets}セットを保存しました"
+                    st.rerun()
+
+# プロセスで最初の実行のときに、認証とProgramsとTrainingLogの読み込みを裏で始める
+# 最初の画面（タイプ選択）はこれを待たずに出し、ページを開くころにはキャッシュが埋まっている
+@st.cache_resource
+def start_prewarm():
+    def prewarm():
+        try:
+            if get_gsheet_client() is None:
+                return
+            preload_sheets()
+            get_programs_refresher().get()
+            get_log_refresher().get()
+        except Exception:
+            # 失敗した分は各ページの通常の読み込みでやり直す
+            pass
+    thread = threading.Thread(target=prewarm, name="prewarm", daemon=True)
+    thread.start()
+    return thread
+
+start_prewarm()
+
 # Type選択をセッション状態で管理
 if 'selected_type' not in st.session_state:
     st.session_state.selected_type = None
@@ -239,6 +735,43 @@ with st.sidebar.expander("🔍 診断ツール"):
         else:
             st.error("❌ 接続失敗")
     
+    try:
+        counts = get_sheets_pool().counts
+        st.caption(f"接続キャッシュ: ヒット {counts['spreadsheet_hit'] + counts['worksheet_hit']} / ミス {counts['spreadsheet_miss'] + counts['worksheet_miss']} / 再接続 {counts['reconnect']}")
+        usage = get_sheets_governor().usage()
+        reads = sum(n for key, n in usage['counts'].items() if key.startswith('read:'))
+        writes = sum(n for key, n in usage['counts'].items() if key.startswith('write:'))
+        st.caption(f"API呼び出し: 読み込み {reads} / 書き込み {writes}（残りトークン 読み {usage['tokens']['read']} / 書き {usage['tokens']['write']}、見送り {usage['deferred']}、429 {usage['quota_errors']}）")
+        source = get_programs_source()
+        st.caption(f"プログラムの変更確認: {source.checks}回（全件読み込み {source.full_fetches}回、変更 {source.changes}回）")
+        if not source.has_version_cell:
+            st.caption(f"⚠️ secretsのprograms_version_rangeが未設定のため、更新時刻で確認しています（ログの保存でも変わるので、Programsの編集の反映は最大{source.modified_time_interval // 60}分遅れます）")
+        for label, refresher in [("プログラム", get_programs_refresher()), ("トレーニングログ", get_log_refresher())]:
+            if refresher.loaded_at is None:
+                continue
+            state = "（更新中）" if refresher.refreshing else ""
+            st.caption(f"{label}: {refresher.age():.0f}秒前のデータ{state}")
+            if refresher.last_error:
+                st.caption(f"⚠️ {label}の更新失敗: {refresher.last_error}")
+        # このプロセスが保持しているログのメモリ（ページを開いて読み込んだ分）
+        reader = get_created_resources().get('training_log_reader')
+        cached_log = reader.df if reader is not None else pd.DataFrame()
+        if len(cached_log) > 0:
+            report = memory_report(cached_log)
+            st.caption(f"ログのメモリ: {report['バイト'].sum() / 1024 ** 2:.1f} MB（{len(cached_log):,}行、{report['バイト'].sum() / len(cached_log):.0f} B/行）")
+            if st.checkbox("列ごとの内訳", key="show_memory_report"):
+                st.dataframe(report.assign(MB=(report['バイト'] / 1024 ** 2).round(2)).drop(columns='バイト'), use_container_width=True)
+    except Exception:
+        pass
+    
+    recent_runs = get_perf_recorder().recent(get_perf_session_id(), limit=10)
+    if recent_runs:
+        st.caption("直近の再実行（ms）")
+        st.dataframe(pd.DataFrame([
+            {'時刻': run['ts'][11:19], 'ページ': run['page'] or '-', '合計': run['total_ms'], **{name: run['spans'].get(name, 0.0) for name in PERF_SPANS}}
+            for run in reversed(recent_runs)
+        ]), hide_index=True, use_container_width=True)
+    
     if st.button("セッションリセット", use_container_width=True):
         keys_to_delete = [k for k in list(st.session_state.keys()) if k != 'selected_type']
         for key in keys_to_delete:
@@ -319,7 +852,29 @@ if st.sidebar.button("タイプ変更"):
         del st.query_params["exercise"]
     st.rerun()
 
-page = st.sidebar.selectbox("ページを選択", ["プログラム一覧", "Training Log 入力", "データ管理"])
+page = st.sidebar.selectbox("ページを選択", ["プログラム一覧", "Training Log 入力", "チーム分析", "データ管理"])
+perf_trace.page = page
+
+# スナップショット表示中（起動直後・Google Sheets障害中）の案内
+if is_read_only():
+    snapshot_meta = get_snapshot_store().meta("training_log") or get_snapshot_store().meta("programs") or {}
+    saved_at = datetime.fromtimestamp(snapshot_meta['saved_at']).strftime('%m/%d %H:%M') if snapshot_meta.get('saved_at') else '前回'
+    if get_log_refresher().last_error or get_programs_refresher().last_error or get_gsheet_client() is None:
+        st.sidebar.warning(f"📴 Google Sheetsに接続できません。{saved_at}時点のデータを表示しています（読み取り専用）")
+    else:
+        st.sidebar.info(f"🔄 {saved_at}時点のデータを表示中です。最新のデータを読み込んでいます…")
+
+# このセッションの保存状況
+if 'writer_session_id' in st.session_state:
+    write_status = get_training_log_writer().status(st.session_state.writer_session_id)
+    if write_status['pending'] > 0:
+        st.sidebar.warning(f"⏳ 保存待ち: {write_status['pending']}セット")
+        if write_status['last_error']:
+            st.sidebar.caption(f"再送待ち: {write_status['last_error']}")
+    elif write_status['acked'] > 0:
+        st.sidebar.caption(f"✅ 保存済み: {write_status['acked']}セット")
+    if write_status['failed'] > 0:
+        st.sidebar.error(f"❌ 保存できなかったセット: {write_status['failed']}（{write_status['failed_error']}）")
 
 if page == "Training Log 入力":
     st.title("Training Log 入力")
@@ -335,62 +890,38 @@ if page == "Training Log 入力":
     
     st.markdown(f"""<div style="background: linear-gradient(135deg, #2C3E50 0%, #34495E 100%); padding: 15px 20px; border-radius: 12px; margin: 15px 0; text-align: center; box-shadow: 0 6px 20px rgba(44, 62, 80, 0.25);"><h2 style="color: #ECF0F1; margin: 0; font-size: 24px; font-weight: 600;">TRAINING LOG INPUT</h2><p style="color: #BDC3C7; margin: 8px 0 0 0; font-size: 14px;">トレーニング記録を入力 - {st.session_state.selected_type}</p></div>""", unsafe_allow_html=True)
     
-    player_name = st.text_input("選手名", key="player_name", placeholder="例: 田中太郎")
-    body_weight = st.number_input("体重 (kg)", min_value=30.0, max_value=200.0, value=70.0, step=0.1, key="body_weight")
+    entry_mode = st.radio("入力方法", ["選手ごとに入力", "コーチ一括入力"], key="entry_mode", horizontal=True)
+    if entry_mode == "選手ごとに入力":
+        player_name = st.text_input("選手名", key="player_name", placeholder="例: 田中太郎")
+        body_weight = st.number_input("体重 (kg)", min_value=30.0, max_value=200.0, value=70.0, step=0.1, key="body_weight")
     
     available_programs = program_df['Program'].unique()
     st.markdown("### プログラム選択")
     selected_program = st.selectbox("実行するプログラム", available_programs, help="エクセルで設定されたトレーニングプログラムから選択")
     
-    if selected_program:
-        program_exercises = program_df[program_df['Program'] == selected_program].reset_index(drop=True)
-        main_exercises = program_exercises[~program_exercises['No'].isin(['WU', 'ST', 'PL'])] if 'No' in program_exercises.columns else program_exercises
-        
-        grouped_exercises = []
-        seen_exercises = set()
-        for _, exercise in main_exercises.iterrows():
-            exercise_name = exercise['Exercise']
-            if exercise_name not in seen_exercises:
-                same_exercises = main_exercises[main_exercises['Exercise'] == exercise_name]
-                grouped_exercise = {
-                    'Exercise': exercise_name,
-                    'No': same_exercises['No'].iloc[0] if 'No' in same_exercises.columns else '',
-                    'set': '・'.join(map(str, same_exercises['set'])),
-                    'load': '・'.join(map(str, same_exercises['load'])),
-                    'rep': '・'.join(map(str, same_exercises['rep'])),
-                    'Type': same_exercises['Type'].iloc[0] if 'Type' in same_exercises.columns else ''
-                }
-                if 'Point' in same_exercises.columns:
-                    grouped_exercise['Point'] = same_exercises['Point'].iloc[0]
-                grouped_exercises.append(grouped_exercise)
-                seen_exercises.add(exercise_name)
+    if selected_program and entry_mode == "コーチ一括入力":
+        st.markdown(f"### プログラム {selected_program}（一括入力）")
+        render_bulk_entry(st.session_state.selected_type, selected_program)
+    elif selected_program:
+        compiled_program = get_compiled_program(st.session_state.selected_type, selected_program)
+        grouped_exercises = compiled_program['exercises']
         
         st.markdown(f"### プログラム {selected_program}")
         
-        warmup_exercises = program_exercises[program_exercises['No'].isin(['WU', 'ST', 'PL'])] if 'No' in program_exercises.columns else pd.DataFrame()
+        warmup_exercises = compiled_program['warmups']
         if len(warmup_exercises) > 0:
             st.markdown("#### ウォーミングアップ・補助種目")
-            for _, warmup in warmup_exercises.iterrows():
+            for warmup in warmup_exercises:
                 exercise_type = "WU " if warmup['No'] == 'WU' else "ST " if warmup['No'] == 'ST' else "PL "
-                warmup_details = []
-                if pd.notna(warmup['set']) and warmup['set'] != '-':
-                    warmup_details.append(f"{warmup['set']}セット")
-                if pd.notna(warmup['rep']) and warmup['rep'] != '-':
-                    warmup_details.append(f"{warmup['rep']}レップ")
-                if pd.notna(warmup['load']) and warmup['load'] != '-':
-                    load_display = warmup['load']
-                    if str(load_display).replace('.', '').isdigit() and float(load_display) <= 1.0:
-                        load_display = f"{float(load_display)*100:.0f}%"
-                    warmup_details.append(f"{load_display}")
-                detail_text = " / ".join(warmup_details) if warmup_details else ""
+                detail_text = warmup['detail_text']
                 type_display = ""
-                if 'Type' in warmup.index and pd.notna(warmup['Type']) and warmup['Type'] != '':
+                if pd.notna(warmup['Type']) and warmup['Type'] != '':
                     type_display = f" {get_category_display(warmup['Type'])}"
                 if detail_text:
                     st.markdown(f"• {exercise_type}**{warmup['Exercise']}**{type_display} - {detail_text}", unsafe_allow_html=True)
                 else:
                     st.markdown(f"• {exercise_type}**{warmup['Exercise']}**{type_display}", unsafe_allow_html=True)
-                if 'Point' in warmup and pd.notna(warmup['Point']) and warmup['Point'] != '':
+                if pd.notna(warmup['Point']) and warmup['Point'] != '':
                     st.markdown(f"  POINT: {warmup['Point']}")
             st.markdown("---")
         
@@ -399,26 +930,10 @@ if page == "Training Log 入力":
         if 'selected_exercise_idx' not in st.session_state:
             st.session_state.selected_exercise_idx = None
         
-        # 全適用の保留フラグ
-        if 'pending_apply_all' not in st.session_state:
-            st.session_state.pending_apply_all = None
-        
         st.markdown("""<div style="background: rgba(44, 62, 80, 0.03); padding: 15px; border-radius: 10px; margin: 15px 0;"><p style="color: #34495E; margin: 0; font-size: 14px; font-weight: 500; text-align: center;">実施する種目を選択してください</p></div>""", unsafe_allow_html=True)
         
         for idx, exercise in enumerate(grouped_exercises):
-            load_display = exercise['load']
-            if '・' in str(load_display):
-                loads = str(load_display).split('・')
-                formatted_loads = []
-                for load in loads:
-                    if load.replace('.', '').isdigit() and float(load) <= 1.0:
-                        formatted_loads.append(f"{float(load)*100:.0f}%")
-                    else:
-                        formatted_loads.append(load)
-                load_display = '・'.join(formatted_loads)
-            else:
-                if str(load_display).replace('.', '').isdigit() and float(load_display) <= 1.0:
-                    load_display = f"{float(load_display)*100:.0f}%"
+            load_display = exercise['load_display']
             
             is_selected = st.session_state.selected_exercise_idx == idx
             button_type = "primary" if is_selected else "secondary"
@@ -439,241 +954,7 @@ if page == "Training Log 入力":
                     save_session_to_url()
             
             if st.session_state.selected_exercise_idx == idx:
-                exercise_title = f"{exercise.get('No', '')} {exercise['Exercise']}"
-                with st.expander(f"記録入力: {exercise_title}", expanded=True):
-                    if exercise.get('Type') and exercise['Type'] != '':
-                        st.markdown(f"""<div style="background: linear-gradient(135deg, rgba(108, 117, 125, 0.1) 0%, rgba(73, 80, 87, 0.1) 100%); border-left: 4px solid #6c757d; padding: 8px 12px; margin: 8px 0; border-radius: 6px; text-align: center;"><div style="color: #495057; font-weight: 600; font-size: 14px;">Type: {get_category_display(exercise['Type'])}</div></div>""", unsafe_allow_html=True)
-                    
-                    # ★★★ 前回の記録表示 ★★★
-                    log_df = load_training_log()
-                    
-                    if len(log_df) > 0 and player_name:
-                        # エクササイズ名でフィルタリング
-                        exercise_history = log_df[
-                            (log_df['名前'] == player_name) & 
-                            (log_df['エクササイズ名'] == exercise['Exercise'])
-                        ].copy()
-                        
-                        if len(exercise_history) > 0:
-                            # 日付でソート（降順）
-                            if '日付' in exercise_history.columns:
-                                exercise_history = exercise_history.sort_values('日付', ascending=False)
-                                
-                                # 最新の日付を取得
-                                latest_date = exercise_history['日付'].max()
-                                latest_session = exercise_history[exercise_history['日付'] == latest_date].copy()
-                                
-                                if len(latest_session) > 0:
-                                    # set列を数値化して最大値を取得
-                                    if 'set_数値' in latest_session.columns:
-                                        last_set_idx = latest_session['set_数値'].idxmax()
-                                    elif 'set' in latest_session.columns:
-                                        latest_session['set_temp'] = pd.to_numeric(latest_session['set'], errors='coerce')
-                                        last_set_idx = latest_session['set_temp'].idxmax()
-                                    else:
-                                        last_set_idx = latest_session.index[-1]
-                                    
-                                    last_set = latest_session.loc[last_set_idx]
-                                    
-                                    # データを取得
-                                    latest_date_str = pd.to_datetime(last_set['日付']).strftime('%m/%d') if pd.notna(last_set['日付']) else '-'
-                                    last_set_num = last_set['set'] if pd.notna(last_set['set']) else '-'
-                                    last_load = last_set['負荷'] if pd.notna(last_set['負荷']) and str(last_set['負荷']).strip() != '' else '-'
-                                    last_reps = int(float(last_set['回数'])) if pd.notna(last_set['回数']) and str(last_set['回数']).strip() != '' else '-'
-                                    
-                                    # 総負荷量を計算
-                                    if '総負荷量' in last_set.index and pd.notna(last_set['総負荷量']) and str(last_set['総負荷量']).strip() != '':
-                                        try:
-                                            last_total = float(last_set['総負荷量'])
-                                        except:
-                                            last_total = '-'
-                                    else:
-                                        # 手動計算
-                                        if last_reps != '-' and last_load != '-':
-                                            try:
-                                                load_str = str(last_load).replace('kg', '').replace('%', '').strip()
-                                                if load_str and load_str != '体重':
-                                                    load_num = float(load_str)
-                                                    last_total = load_num * last_reps
-                                                else:
-                                                    last_total = '-'
-                                            except:
-                                                last_total = '-'
-                                        else:
-                                            last_total = '-'
-                                    
-                                    # 総セット数を計算
-                                    total_sets = len(latest_session)
-                                    
-                                    st.markdown(f"""
-                                    <div style="background: linear-gradient(135deg, rgba(25, 118, 210, 0.1) 0%, rgba(21, 101, 192, 0.1) 100%); 
-                                         border: 2px solid rgba(25, 118, 210, 0.3); border-radius: 12px; padding: 16px; margin: 12px 0;">
-                                        <h5 style="color: #1976d2; margin: 0 0 12px 0; font-size: 16px; font-weight: 700;">
-                                            📈 前回のトレーニング ({latest_date_str})
-                                        </h5>
-                                        <div style="display: grid; grid-template-columns: repeat(2, 1fr); gap: 12px; margin-top: 12px;">
-                                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">総セット数</div>
-                                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">{total_sets}セット</div>
-                                            </div>
-                                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">最終セット</div>
-                                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">SET {last_set_num}</div>
-                                            </div>
-                                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">重量</div>
-                                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">{last_load}</div>
-                                            </div>
-                                            <div style="background: white; padding: 10px; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                                                <div style="color: #666; font-size: 12px; margin-bottom: 4px;">レップ数</div>
-                                                <div style="color: #1976d2; font-size: 20px; font-weight: 700;">{last_reps}回</div>
-                                            </div>
-                                        </div>
-                                        <div style="background: rgba(25, 118, 210, 0.1); padding: 8px; border-radius: 6px; margin-top: 12px; text-align: center;">
-                                            <div style="color: #1976d2; font-size: 13px; font-weight: 600;">
-                                                最終セット総負荷量: {last_total} kg
-                                            </div>
-                                        </div>
-                                    </div>
-                                    """, unsafe_allow_html=True)
-                                else:
-                                    st.markdown("""<div style="background: linear-gradient(135deg, rgba(96, 125, 139, 0.1) 0%, rgba(120, 144, 156, 0.1) 100%); border: 2px dashed rgba(96, 125, 139, 0.3); border-radius: 8px; padding: 16px; margin: 12px 0; text-align: center;"><div style="color: #607d8b; font-size: 16px; font-weight: 600;">🌟 初回トレーニング</div></div>""", unsafe_allow_html=True)
-                            else:
-                                st.markdown("""<div style="background: linear-gradient(135deg, rgba(96, 125, 139, 0.1) 0%, rgba(120, 144, 156, 0.1) 100%); border: 2px dashed rgba(96, 125, 139, 0.3); border-radius: 8px; padding: 16px; margin: 12px 0; text-align: center;"><div style="color: #607d8b; font-size: 16px; font-weight: 600;">🌟 初回トレーニング</div></div>""", unsafe_allow_html=True)
-                        else:
-                            st.markdown("""<div style="background: linear-gradient(135deg, rgba(96, 125, 139, 0.1) 0%, rgba(120, 144, 156, 0.1) 100%); border: 2px dashed rgba(96, 125, 139, 0.3); border-radius: 8px; padding: 16px; margin: 12px 0; text-align: center;"><div style="color: #607d8b; font-size: 16px; font-weight: 600;">🌟 初回トレーニング</div></div>""", unsafe_allow_html=True)
-                    elif not player_name:
-                        st.markdown("""<div style="background: rgba(255, 193, 7, 0.1); border: 2px solid rgba(255, 193, 7, 0.3); border-radius: 8px; padding: 12px; margin: 12px 0; text-align: center;"><div style="color: #f57c00; font-size: 14px; font-weight: 600;">⚠️ 選手名を入力すると前回のデータが表示されます</div></div>""", unsafe_allow_html=True)
-                    
-                    if 'Point' in exercise and exercise['Point'] and pd.notna(exercise['Point']) and exercise['Point'] != '':
-                        st.markdown(f"""<div style="background: linear-gradient(135deg, rgba(108, 117, 125, 0.1) 0%, rgba(73, 80, 87, 0.1) 100%); border-left: 4px solid #6c757d; padding: 10px 15px; margin: 10px 0 15px 0; border-radius: 6px;"><p style="margin: 0; color: #495057; font-weight: 600; font-size: 13px;"><span style="color: #6c757d; font-weight: 700;">POINT:</span> {exercise['Point']}</p></div>""", unsafe_allow_html=True)
-                    
-                    total_sets = sum([int(s) for s in exercise['set'].split('・')])
-                    actual_sets = st.number_input("実施セット数", min_value=1, value=total_sets, key=f"sets_{idx}", help=f"予定: {exercise['set']}")
-                    
-                    st.markdown("**記録入力:**")
-                    
-                    # 全適用の処理（ウィジェット作成前）
-                    if st.session_state.pending_apply_all == idx:
-                        set1_unit = st.session_state.get(f"unit_{idx}_0", "kg")
-                        set1_rep = st.session_state.get(f"rep_{idx}_0", 1)
-                        
-                        if set1_unit == "その他":
-                            set1_load_text = st.session_state.get(f"load_{idx}_0", "")
-                        elif set1_unit == "体重":
-                            set1_load_text = "体重"
-                        else:
-                            set1_load_val = st.session_state.get(f"load_val_{idx}_0", 0.0)
-                        
-                        for set_num in range(1, actual_sets):
-                            st.session_state[f"unit_{idx}_{set_num}"] = set1_unit
-                            st.session_state[f"rep_{idx}_{set_num}"] = set1_rep
-                            
-                            if set1_unit == "その他":
-                                st.session_state[f"load_{idx}_{set_num}"] = set1_load_text
-                            elif set1_unit != "体重":
-                                st.session_state[f"load_val_{idx}_{set_num}"] = set1_load_val
-                        
-                        st.session_state.pending_apply_all = None
-                        st.success("✅ 全セットに適用しました")
-                    
-                    loads = []
-                    reps = []
-                    
-                    for set_num in range(actual_sets):
-                        st.markdown(f"""<div style="background: linear-gradient(135deg, rgba(52, 73, 94, 0.1) 0%, rgba(44, 62, 80, 0.1) 100%); border-left: 3px solid #34495e; padding: 6px 10px; margin: 8px 0 4px 0; border-radius: 4px;"><span style="color: #2c3e50; font-weight: 600; font-size: 13px;">SET {set_num + 1}</span></div>""", unsafe_allow_html=True)
-                        
-                        col1, col2, col3, col4 = st.columns([1, 1, 1, 0.7])
-                        
-                        with col1:
-                            unit = st.selectbox(
-                                "単位",
-                                ["kg", "%", "体重", "その他"],
-                                key=f"unit_{idx}_{set_num}",
-                                label_visibility="collapsed"
-                            )
-                        
-                        with col2:
-                            if unit == "その他":
-                                set_load = st.text_input(
-                                    "負荷",
-                                    key=f"load_{idx}_{set_num}",
-                                    placeholder="負荷",
-                                    label_visibility="collapsed"
-                                )
-                            elif unit == "体重":
-                                set_load = "体重"
-                                st.text_input("負荷", value="体重", disabled=True, key=f"load_disabled_{idx}_{set_num}", label_visibility="collapsed")
-                            else:
-                                load_value = st.number_input(
-                                    "値",
-                                    min_value=0.0,
-                                    step=0.1 if unit == "%" else 0.5,
-                                    key=f"load_val_{idx}_{set_num}",
-                                    label_visibility="collapsed"
-                                )
-                                set_load = f"{load_value}{unit}"
-                            
-                            loads.append(set_load)
-                        
-                        with col3:
-                            set_rep = st.number_input(
-                                "レップ数",
-                                min_value=0,
-                                key=f"rep_{idx}_{set_num}",
-                                label_visibility="collapsed"
-                            )
-                            reps.append(set_rep)
-                        
-                        with col4:
-                            if set_num == 0 and actual_sets > 1:
-                                if st.button("全適用", key=f"copy_all_{idx}", help="この設定を全セットに適用"):
-                                    st.session_state.pending_apply_all = idx
-                            else:
-                                st.write("")
-                    
-                    col_btn1, col_btn2 = st.columns(2)
-                    with col_btn1:
-                        if st.button(f"{exercise['Exercise']} 完了", key=f"complete_{idx}", type="primary", use_container_width=True):
-                            if not player_name:
-                                st.error("選手名を入力してください")
-                            else:
-                                try:
-                                    sets_data = []
-                                    for set_num in range(actual_sets):
-                                        sets_data.append({'set_number': set_num + 1, 'load': loads[set_num], 'reps': reps[set_num]})
-                                    exercise_type = exercise.get('Type', '')
-                                    with st.spinner('保存中...'):
-                                        saved_sets = save_training_log_formatted(
-                                            player_name=player_name, 
-                                            program_name=selected_program, 
-                                            exercise_name=exercise['Exercise'], 
-                                            exercise_category=exercise_type, 
-                                            sets_data=sets_data, 
-                                            body_weight=body_weight
-                                        )
-                                    if saved_sets > 0:
-                                        # 状態をクリーンアップ
-                                        st.session_state.selected_exercise_idx = None
-                                        if "exercise" in st.query_params:
-                                            del st.query_params["exercise"]
-                                        if 'pending_apply_all' in st.session_state:
-                                            st.session_state.pending_apply_all = None
-                                        # 成功メッセージを表示してリロード
-                                        st.success(f"✅ {exercise['Exercise']} 完了！{saved_sets}セットのデータを保存しました。")
-                                        st.rerun()
-                                    else:
-                                        st.error("❌ データの保存に失敗しました")
-                                except Exception as e:
-                                    st.error(f"❌ エラーが発生しました: {str(e)[:100]}")
-                    with col_btn2:
-                        if st.button("種目選択に戻る", key=f"back_{idx}", use_container_width=True):
-                            st.session_state.selected_exercise_idx = None
-                            if "exercise" in st.query_params:
-                                del st.query_params["exercise"]
-                            if 'pending_apply_all' in st.session_state:
-                                st.session_state.pending_apply_all = None
-                            st.rerun()
+                render_set_entry(idx, exercise, player_name, body_weight, selected_program)
         
         if st.session_state.selected_exercise_idx is None:
             st.markdown("---")
@@ -689,6 +970,46 @@ if page == "Training Log 入力":
                 if st.button("新しいトレーニングを開始", type="secondary", use_container_width=True):
                     st.session_state.program_completed = False
 
+elif page == "チーム分析":
+    st.title("チーム分析")
+    today = datetime.today().date()
+    load_training_log(analytics_window(today)[1])
+    analytics = get_training_analytics(get_training_log_reader().revision, today)
+    category = st.session_state.selected_type
+    roster = team_roster(analytics['player_programs'], category)
+    if not roster:
+        st.info(f"{category}の選手の記録がありません")
+        st.stop()
+    st.caption(f"{category}: {len(roster)}名")
+    
+    st.markdown("### 急性:慢性負荷比（ACWR）")
+    st.caption("直近7日の総負荷量 ÷ 直近28日の週平均（0.8〜1.3が目安）")
+    acwr = analytics['acwr_latest'].reindex(roster)
+    st.dataframe(acwr.assign(状態=acwr['ACWR'].map(acwr_status)).round({'直近': 0, '慢性（週平均）': 0, 'ACWR': 2}), use_container_width=True)
+    
+    st.markdown("### 週間総負荷量（Category別）")
+    volume = analytics['weekly_volume']
+    volume = volume[volume.index.get_level_values('名前').isin(roster)]
+    selected_player = st.selectbox("選手", ["チーム合計"] + roster, key="analytics_player")
+    if selected_player == "チーム合計":
+        weekly = volume.groupby(level='週').sum()
+    else:
+        weekly = volume.xs(selected_player, level='名前') if selected_player in volume.index.get_level_values('名前') else volume.head(0)
+    weekly = weekly.sort_index().tail(ANALYTICS_WEEKS)
+    if len(weekly) > 0:
+        st.bar_chart(weekly[CATEGORIES])
+    else:
+        st.info("記録がありません")
+    
+    st.markdown(f"### 推定1RM（Epley式、直近{ANALYTICS_WEEKS}週）")
+    e1rm = analytics['e1rm']
+    e1rm = e1rm[e1rm['名前'].isin(roster)]
+    exercises = sorted(e1rm['エクササイズ名'].unique())
+    selected_exercise = st.selectbox("エクササイズ", exercises, key="analytics_exercise") if exercises else None
+    if selected_exercise:
+        best = e1rm[e1rm['エクササイズ名'] == selected_exercise].drop(columns='エクササイズ名').set_index('名前')
+        st.dataframe(best.assign(日付=best['日付'].dt.strftime('%Y/%m/%d')).round({'e1rm': 1}).sort_values('e1rm', ascending=False), use_container_width=True)
+
 elif page == "データ管理":
     st.title("データ管理")
     st.markdown("### Google Sheets連携状態")
@@ -698,10 +1019,14 @@ elif page == "データ管理":
         st.success(f"✅ 接続成功: {spreadsheet.title}")
         
         st.markdown("### データダウンロード")
+        # 版はログを読む前に控える（読み込み中に追記されても、古い内容を新しい版の名前で保存しない）
+        log_revision = get_training_log_reader().revision
         log_df = load_training_log()
+        metrics = get_log_metrics()
         if len(log_df) > 0:
-            csv = log_df.to_csv(index=False, encoding='utf-8-sig')
-            st.download_button("📥 トレーニングログをCSVダウンロード", csv, f"training_log_{datetime.today().strftime('%Y%m%d')}.csv", "text/csv")
+            render_export_controls(log_df, metrics, log_revision)
+            st.markdown("### トレーニングレポート（PDF）")
+            render_report_controls(log_df, metrics, log_revision)
         else:
             st.info("ダウンロード可能なデータがありません")
         
@@ -710,35 +1035,27 @@ elif page == "データ管理":
         if len(log_df) > 0:
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric("総ログ数", len(log_df))
+                st.metric("総ログ数", metrics['total_logs'])
             with col2:
-                unique_players = log_df['名前'].nunique() if '名前' in log_df.columns else 0
-                st.metric("登録選手数", unique_players)
+                st.metric("登録選手数", metrics['players'])
             with col3:
-                if '日付' in log_df.columns:
-                    log_df['日付'] = pd.to_datetime(log_df['日付'])
-                    latest_date = log_df['日付'].max().strftime('%Y/%m/%d')
-                    st.metric("最新記録日", latest_date)
+                if pd.notna(metrics['latest_date']):
+                    st.metric("最新記録日", metrics['latest_date'].strftime('%Y/%m/%d'))
             with col4:
-                if 'Category' in log_df.columns:
-                    unique_categories = len([cat for cat in log_df['Category'].unique() if cat != '' and pd.notna(cat)])
-                    st.metric("カテゴリー数", unique_categories)
+                st.metric("カテゴリー数", metrics['categories'])
             
-            if '名前' in log_df.columns:
+            if len(metrics['player_counts']) > 0:
                 st.markdown("#### 選手別ログ数")
-                player_counts = log_df['名前'].value_counts()
-                st.bar_chart(player_counts)
+                st.bar_chart(metrics['player_counts'])
             
-            if 'Category' in log_df.columns:
+            if len(metrics['category_counts']) > 0:
                 st.markdown("#### カテゴリー別ログ数")
-                category_counts = log_df[log_df['Category'] != '']['Category'].value_counts()
-                if len(category_counts) > 0:
-                    st.bar_chart(category_counts)
+                st.bar_chart(metrics['category_counts'])
         
         st.markdown("---")
         st.markdown("### Google Sheetsリンク")
         if st.button("📊 Google Sheetsを開く"):
-            st.markdown(f"[Google Sheetsで開く]({st.secrets['spreadsheet_url']})")
+            st.markdown(f"[Google Sheetsで開く]({st.secrets.get('spreadsheet_url', '')})")
     else:
         st.error("❌ Google Sheetsに接続できません。設定を確認してください。")
     
@@ -774,55 +1091,55 @@ elif page == "プログラム一覧":
         st.error("プログラムデータを読み込めませんでした。")
         st.stop()
     
-    program_df = program_df[program_df['Category'] == st.session_state.selected_type]
+    catalog = get_program_catalog(load_programs_revision())
+    category = st.session_state.selected_type
     
-    st.markdown(f"### {st.session_state.selected_type} プログラム一覧")
+    st.markdown(f"### {category} プログラム一覧")
     
-    available_programs = program_df['Program'].unique()
+    available_programs = catalog.programs(category)
     st.markdown("### プログラム検索")
     col_search1, col_search2, col_search3 = st.columns(3)
     with col_search1:
-        selected_programs = st.multiselect("プログラムを選択", ["すべて"] + list(available_programs), default=["すべて"], help="複数選択可能")
+        selected_programs = st.multiselect("プログラムを選択", ["すべて"] + available_programs, default=["すべて"], help="複数選択可能")
     with col_search2:
         exercise_search = st.text_input("エクササイズ名で検索", placeholder="例: Squat, Bench")
     with col_search3:
-        available_types = ["すべて"] + [cat for cat in program_df['Type'].unique() if cat != '' and pd.notna(cat)]
+        available_types = ["すべて"] + catalog.types(category)
         selected_type_filter = st.selectbox("Typeで絞り込み", available_types)
     
-    if "すべて" not in selected_programs and selected_programs:
-        filtered_programs = selected_programs
-    else:
-        filtered_programs = list(available_programs)
-    if exercise_search:
-        exercise_matches = program_df[program_df['Exercise'].str.contains(exercise_search, case=False, na=False)]['Program'].unique()
-        filtered_programs = [prog for prog in filtered_programs if prog in exercise_matches]
-    if selected_type_filter != "すべて":
-        type_matches = program_df[program_df['Type'] == selected_type_filter]['Program'].unique()
-        filtered_programs = [prog for prog in filtered_programs if prog in type_matches]
+    filtered_programs = catalog.search(
+        category,
+        programs=selected_programs if "すべて" not in selected_programs and selected_programs else None,
+        exercise_query=exercise_search,
+        type_filter=None if selected_type_filter == "すべて" else selected_type_filter,
+    )
     
     if len(selected_programs) > 1 or (len(selected_programs) == 1 and "すべて" not in selected_programs) or exercise_search or selected_type_filter != "すべて":
         st.markdown(f"**検索結果: {len(filtered_programs)}件**")
     
-    for program in filtered_programs:
-        with st.expander(f"{program}", expanded=len(filtered_programs) <= 3):
-            program_exercises = program_df[program_df['Program'] == program]
-            warmup_exercises = program_exercises[program_exercises['No'].isin(['WU', 'ST', 'PL'])] if 'No' in program_exercises.columns else pd.DataFrame()
-            if len(warmup_exercises) > 0:
+    # 1ページ分の見出しだけを出し、表は開いたプログラムの分だけ作る
+    page_count = max((len(filtered_programs) - 1) // PROGRAMS_PER_PAGE + 1, 1)
+    page_number = st.selectbox(f"ページ（全{page_count}ページ）", range(1, page_count + 1), key="program_list_page") if page_count > 1 else 1
+    page_programs = filtered_programs[(page_number - 1) * PROGRAMS_PER_PAGE:page_number * PROGRAMS_PER_PAGE]
+    
+    for program in page_programs:
+        expander = st.expander(f"{program}", expanded=len(filtered_programs) <= 3, key=f"program_view_{category}_{program}", on_change="rerun")
+        if not expander.open:
+            continue
+        with expander:
+            table = catalog.table(category, program)
+            if len(table['warmups']) > 0:
                 st.markdown("""<div style="background: rgba(108, 117, 125, 0.08); border-left: 3px solid #6c757d; padding: 8px 12px; margin: 10px 0; border-radius: 6px;"><h4 style="color: #495057; margin: 0; font-size: 14px; font-weight: 600;">WARM UP & AUXILIARY</h4></div>""", unsafe_allow_html=True)
-                for _, warmup in warmup_exercises.iterrows():
-                    exercise_type = "WU " if warmup['No'] == 'WU' else "ST " if warmup['No'] == 'ST' else "PL "
-                    st.markdown(f"• {exercise_type}**{warmup['Exercise']}**")
+                for no, exercise_name in table['warmups']:
+                    exercise_type = "WU " if no == 'WU' else "ST " if no == 'ST' else "PL "
+                    st.markdown(f"• {exercise_type}**{exercise_name}**")
                 st.markdown("---")
             
-            main_exercises = program_exercises[~program_exercises['No'].isin(['WU', 'ST', 'PL'])] if 'No' in program_exercises.columns else program_exercises
-            if len(main_exercises) > 0:
+            if len(table['main']) > 0:
                 st.markdown("""<div style="background: rgba(73, 80, 87, 0.08); border-left: 3px solid #495057; padding: 8px 12px; margin: 10px 0; border-radius: 6px;"><h4 style="color: #495057; margin: 0; font-size: 14px; font-weight: 600;">MAIN EXERCISES</h4></div>""", unsafe_allow_html=True)
-                display_df = main_exercises[['No', 'Exercise', 'Type', 'set', 'load', 'rep']].copy()
-                display_df.columns = ['No.', 'エクササイズ', 'Type', 'セット数', '負荷', 'レップ数']
-                for col in display_df.columns:
-                    display_df[col] = display_df[col].astype(str)
-                display_df.index = range(1, len(display_df) + 1)
-                st.dataframe(display_df, use_container_width=True)
+                st.dataframe(table['main'], use_container_width=True)
 
 else:
-    st.error("無効なページが選択されました。")
\ No newline at end of file
+    st.error("無効なページが選択されました。")
+
+get_perf_recorder().finish()
@@ -0,0 +1,89 @@
+import threading
+import time
+
+class StaleWhileRevalidate:
+    """古くなっても前回の値をすぐ返し、裏で1本だけ更新を走らせるキャッシュ
+
+    最初の読み込みだけは呼び出し元で同期的に行う（失敗したら例外）。
+    以降はmax_ageを過ぎるとバックグラウンドで1回だけ読み込み直し、成功したら
+    値を差し替える。失敗した場合は前回の値を返し続け、max_age後に再試行する。
+    is_staleを渡すと経過時間の代わりにそれで更新要否を判定する。
+    background_contextを渡すとバックグラウンドでの読み込みをその中で行う。
+    initial=(値, 読み込み時刻) を渡すと最初からその値を持った状態で始め、
+    最初の読み込みもバックグラウンドで行う（保存しておいた前回の値で起動する場合）。
+    """
+
+    def __init__(self, loader, max_age, is_stale=None, name="refresh", background_context=None, initial=None):
+        self._loader = loader
+        self._background_context = background_context
+        self.max_age = max_age
+        self._is_stale = is_stale
+        self.name = name
+        self._load_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self.value = None
+        self.loaded_at = None
+        self.refreshing = False
+        self.last_error = None
+        self._next_attempt = 0.0
+        if initial is not None:
+            self.value, self.loaded_at = initial
+
+    def age(self):
+        return None if self.loaded_at is None else time.time() - self.loaded_at
+
+    def stale(self):
+        if self._is_stale is not None:
+            return self._is_stale()
+        return self.age() > self.max_age
+
+    def get(self):
+        if self.loaded_at is None:
+            with self._load_lock:
+                if self.loaded_at is None:
+                    self._load()
+            return self.value
+        if self.stale() and time.time() >= self._next_attempt:
+            self._start_refresh()
+        return self.value
+
+    def prime(self, value):
+        """別の経路で読み込んだ値を最初の値として入れる（まだ読み込んでいない場合だけ）"""
+        with self._load_lock:
+            if self.loaded_at is None:
+                self.value = value
+                self.loaded_at = time.time()
+                self.last_error = None
+
+    def invalidate(self):
+        self._next_attempt = 0.0
+        if self.loaded_at is not None:
+            self.loaded_at -= self.max_age
+
+    def _start_refresh(self):
+        with self._state_lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh, name=f"{self.name}-refresh", daemon=True).start()
+
+    def _refresh(self):
+        try:
+            with self._load_lock:
+                if self._background_context is not None:
+                    with self._background_context():
+                        self._load()
+                else:
+                    self._load()
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {str(e)[:80]}"
+            self._next_attempt = time.time() + self.max_age
+        finally:
+            self.refreshing = False
+
+    def _load(self):
+        value = self._loader()
+        # 値を入れ替えてから時刻を進める（参照側は常に完成した値を見る）
+        self.value = value
+        self.loaded_at = time.time()
+        self.last_error = None
@@ -0,0 +1,56 @@
+"""負荷パーサーのベンチマーク
+
+100万行の合成ログで parse_loads のスループットを測り、
+以前の行ごとの解析（保存時のtry/exceptループ）と比較する。
+
+    python benchmarks/bench_load_parser.py [行数]
+"""
+import sys
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from training_log import parse_loads  # noqa: E402
+
+LOAD_SAMPLES = ['60kg', '72.5kg', '80', '70.0%', '体重', '体重+10kg', '赤バンド', '']
+
+def synthetic_loads(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    loads = pd.Series(np.array(LOAD_SAMPLES, dtype=object)[rng.integers(0, len(LOAD_SAMPLES), rows)])
+    body_weights = pd.Series(rng.uniform(55, 95, rows).round(1).astype(str))
+    return loads, body_weights
+
+def legacy_parse(loads, body_weights):
+    # 変更前の保存処理と同じ1件ずつの解析
+    values = []
+    for load_value, body_weight in zip(loads, body_weights):
+        if 'kg' in load_value:
+            try:
+                values.append(float(load_value.replace('kg', '')))
+            except ValueError:
+                values.append(0)
+        elif load_value == "体重":
+            values.append(float(body_weight))
+        else:
+            try:
+                values.append(float(load_value))
+            except ValueError:
+                values.append(0)
+    return values
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    loads, body_weights = synthetic_loads(rows)
+    for name, func in [('parse_loads', parse_loads), ('legacy (行ごと)', legacy_parse)]:
+        elapsed = min(timed(func, loads, body_weights) for _ in range(3))
+        print(f"{name:16s} {rows:>9,d}行  {elapsed:7.3f}秒  {rows / elapsed:12,.0f} 行/秒")
+
+if __name__ == '__main__':
+    main()
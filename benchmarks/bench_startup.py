@@ -0,0 +1,141 @@
+"""起動時間のベンチマーク（モジュールの読み込みと最初の表示）
+
+測定ごとに新しいプロセスを立ち上げ、偽のSheetsバックエンド（合成データ）で
+アプリを実行して次の時間を測り、JSONに書き出す。
+
+- import: アプリが起動時に読むモジュール（streamlit・pandasと各モジュール）の読み込み
+- first_render: プロセスで最初の実行（タイプ選択画面）
+- first_page: think_time秒後（利用者がタイプを選ぶまでの時間）にタイプを選び、入力ページを表示するまで
+
+あわせて、起動時の読み込みに含まれてしまった重いライブラリ（gspreadなど）を記録する。
+--baselineに前回の結果を渡すと各項目の比率を表示する。
+
+    python benchmarks/bench_startup.py --log-rows 10000 --latency 0.05 --think-time 1
+    python benchmarks/bench_startup.py --output new.json --baseline old.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# 起動時に読み込まれていないことを確認するライブラリ（plotlyはstreamlit自体が読み込む）
+HEAVY_MODULES = ['gspread', 'oauth2client', 'openpyxl', 'plotly', 'reportlab']
+# app.pyが先頭で読み込むモジュール
+APP_MODULES = [
+    'streamlit', 'pandas', 'analytics', 'background_refresh', 'bulk_entry', 'export', 'partitions',
+    'programs', 'perf_trace', 'reports', 'snapshot', 'sheets_client', 'training_log', 'write_queue',
+]
+RESULT_PREFIX = 'STARTUP_RESULT '
+
+def measure_once(log_rows, latency, think_time):
+    """このプロセスで1回だけ測る（子プロセスとして実行される）"""
+    start = time.perf_counter()
+    for name in APP_MODULES:
+        __import__(name)
+    import_s = time.perf_counter() - start
+    heavy_after_import = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    from streamlit.testing.v1 import AppTest
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        at = AppTest.from_file(str(ROOT / "app.py"), default_timeout=120)
+        at.secrets["fake_sheets"] = {'log_rows': log_rows, 'latency': latency}
+        at.secrets["snapshot_dir"] = snapshot_dir
+        start = time.perf_counter()
+        at.run()
+        first_render_s = time.perf_counter() - start
+
+        time.sleep(think_time)
+        start = time.perf_counter()
+        at.session_state["selected_type"] = 'U18'
+        at.run()
+        at.sidebar.selectbox[0].select("Training Log 入力").run()
+        first_page_s = time.perf_counter() - start
+        errors = [str(e.value)[:80] for e in at.exception]
+
+    return {
+        'import_s': import_s,
+        'first_render_s': first_render_s,
+        'first_page_s': first_page_s,
+        'heavy_modules': heavy_after_import,
+        'errors': errors,
+    }
+
+def git_revision():
+    # bench_suiteはgspreadなどを読み込むので、測定に影響しないようここでは使わない
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_child(log_rows, latency, think_time):
+    completed = subprocess.run(
+        [sys.executable, __file__, '--child', '--log-rows', str(log_rows), '--latency', str(latency), '--think-time', str(think_time)],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            return json.loads(line[len(RESULT_PREFIX):])
+    raise RuntimeError(f"結果を取得できませんでした: {completed.stderr[-500:]}")
+
+def print_results(report, baseline=None):
+    print(f"\n== 起動時間（TrainingLog {report['log_rows']:,}行、遅延 {report['latency_s']}秒、選ぶまで {report['think_time_s']}秒） ==")
+    for name, timing in report['results'].items():
+        if name.startswith('_'):
+            continue
+        line = f"  {name:16s} 最小 {timing['min_s'] * 1000:10.2f} ms  中央値 {timing['median_s'] * 1000:10.2f} ms"
+        previous = (baseline or {}).get('results', {}).get(name)
+        if previous and previous['median_s'] > 0:
+            line += f"  (前回比 x{timing['median_s'] / previous['median_s']:.2f})"
+        print(line)
+    print(f"  起動時に読み込まれた重いライブラリ: {', '.join(report['results']['_heavy_modules']) or 'なし'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log-rows', type=int, default=10000, help='TrainingLogの行数')
+    parser.add_argument('--latency', type=float, default=0.0, help='API呼び出し1回あたりの遅延（秒）')
+    parser.add_argument('--think-time', type=float, default=0.0, help='最初の表示からタイプを選ぶまでの秒数')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_startup.json')
+    parser.add_argument('--baseline', help='比較する前回の結果JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(RESULT_PREFIX + json.dumps(measure_once(args.log_rows, args.latency, args.think_time)))
+        return
+
+    runs = [run_child(args.log_rows, args.latency, args.think_time) for _ in range(args.repeat)]
+    results = {
+        name: {'min_s': min(run[name] for run in runs), 'median_s': statistics.median(run[name] for run in runs)}
+        for name in ['import_s', 'first_render_s', 'first_page_s']
+    }
+    results['_heavy_modules'] = runs[-1]['heavy_modules']
+    results['_errors'] = sorted({error for run in runs for error in run['errors']})
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'log_rows': args.log_rows,
+        'latency_s': args.latency,
+        'think_time_s': args.think_time,
+        'results': results,
+    }
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8')) if args.baseline else None
+    print_results(report, baseline)
+    if results['_errors']:
+        print(f"  エラー: {results['_errors']}")
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"\n結果を {args.output} に書き出しました")
+
+if __name__ == '__main__':
+    main()
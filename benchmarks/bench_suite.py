@@ -0,0 +1,156 @@
+"""偽のSheetsバックエンドを使ったオフラインのベンチマーク
+
+合成のProgramsとTrainingLogを偽バックエンドに載せ、アプリと同じ処理
+（ログの読み込み・プログラムの読み込み（全件／変更確認のみ）・起動時の一括読み込み・プログラムのまとめ・前回記録の検索・
+データ管理の統計（全件から計算／集計済み）・チーム分析・スナップショットの保存と読み込み・PDFレポート・期間で絞り込んだCSV出力）の時間を測ってJSONに書き出す。
+--baselineに前回の結果を渡すと各項目の比率を表示する。
+
+    python benchmarks/bench_suite.py --sizes 1000,10000,100000 --latency 0.05
+    python benchmarks/bench_suite.py --output new.json --baseline old.json
+"""
+import argparse
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+from analytics import build_analytics  # noqa: E402
+from export import ExportCache  # noqa: E402
+from fake_sheets import synthetic_client  # noqa: E402
+from programs import ProgramsSource, compile_programs, fetch_programs  # noqa: E402
+from reports import ReportCache  # noqa: E402
+from sheets_client import SheetsHandlePool  # noqa: E402
+from snapshot import SnapshotStore  # noqa: E402
+from training_log import LogAggregates, TrainingLogSync, build_latest_session_index, log_metrics  # noqa: E402
+
+def measure(func, repeat):
+    """funcをrepeat回実行し、(最小, 中央値) の秒数と最後の戻り値を返す"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), statistics.median(timings), result
+
+def run_size(log_rows, program_rows, latency, repeat):
+    client = synthetic_client(log_rows=log_rows, program_rows=program_rows, latency=latency)
+    pool = SheetsHandlePool(lambda: client, "fake://sheets")
+    results = {}
+
+    def record(name, func, times=repeat):
+        best, median, value = measure(func, times)
+        results[name] = {'min_s': best, 'median_s': median}
+        return value
+
+    # 初回の全件読み込みと、追記が無い場合の差分確認
+    sync = TrainingLogSync()
+    aggregates = LogAggregates()
+    sync.listeners.append(aggregates.on_log_change)
+    record('load_training_log_full', lambda: TrainingLogSync().refresh(pool.worksheet("TrainingLog")))
+    sync.refresh(pool.worksheet("TrainingLog"))
+    record('load_training_log_incremental', lambda: pool.with_worksheet("TrainingLog", sync.refresh))
+    log_df = sync.df
+
+    program_df, _ = record('load_program_file', lambda: fetch_programs(pool))
+    def first_load_batched():
+        # 起動時と同じく、ProgramsとTrainingLogを1回のvalues_batch_getで読む
+        values = pool.batch_values(["Programs", "TrainingLog"])
+        ProgramsSource(pool).preload(values["Programs"])
+        return TrainingLogSync().load_values(values["TrainingLog"])
+    record('first_load_batched', first_load_batched)
+    programs_source = ProgramsSource(pool)
+    programs_source.load()
+    record('program_change_check', programs_source.load)
+    record('program_grouping', lambda: compile_programs(program_df))
+
+    record('latest_session_index_build', lambda: build_latest_session_index(log_df))
+    keys = list(sync.latest_index)[:100] or [("選手01", "Back Squat")]
+    record('previous_record_lookup_x100', lambda: [sync.latest_session(*key) for key in keys])
+    record('data_management_stats', lambda: log_metrics(log_df))
+    record('data_management_stats_aggregated', aggregates.metrics)
+    record('team_analytics', lambda: build_analytics(log_df), times=max(1, repeat // 2))
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        store = SnapshotStore(snapshot_dir)
+        record('snapshot_save', lambda: store.save("training_log", log_df), times=max(1, repeat // 2))
+        record('snapshot_load', lambda: store.load("training_log"))
+    with tempfile.TemporaryDirectory() as report_dir:
+        # 全選手分のPDF（毎回新しい版で作り直す）と、作成済みの版をもう一度求めた場合
+        reports = ReportCache(report_dir)
+        athletes = sorted(log_df['名前'].astype(str).unique())
+        period = (log_df['日付'].min(), log_df['日付'].max())
+        revisions = itertools.count()
+        record('pdf_reports_roster', lambda: reports.roster_archive(log_df, 'U18', athletes, period, next(revisions)), times=max(1, repeat // 2))
+        record('pdf_reports_cached', lambda: reports.roster_archive(log_df, 'U18', athletes, period, 0))
+        reports.close()
+    with tempfile.TemporaryDirectory() as export_dir:
+        # データ管理ページと同じく直近90日分を絞り込んで書き出す（新しい版で作り直す場合と、作成済みの版の場合）
+        exports = ExportCache(export_dir)
+        last_date = log_df['日付'].max()
+        filters = {
+            'start_date': (last_date - pd.Timedelta(days=89)).date(), 'end_date': last_date.date(),
+            'players': [], 'types': [], 'programs': [],
+        }
+        revisions = itertools.count()
+        record('csv_export', lambda: exports.get(log_df, filters, next(revisions), 'CSV'), times=max(1, repeat // 2))
+        record('csv_export_cached', lambda: exports.get(log_df, filters, 0, 'CSV'))
+
+    results['_sheet_calls'] = dict(client.calls)
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def print_results(report, baseline=None):
+    for size, results in report['results'].items():
+        print(f"\n== TrainingLog {int(size):,}行 ==")
+        for name, timing in results.items():
+            if name.startswith('_'):
+                continue
+            line = f"  {name:32s} 最小 {timing['min_s'] * 1000:10.2f} ms  中央値 {timing['median_s'] * 1000:10.2f} ms"
+            previous = (baseline or {}).get('results', {}).get(size, {}).get(name)
+            if previous and previous['median_s'] > 0:
+                line += f"  (前回比 x{timing['median_s'] / previous['median_s']:.2f})"
+            print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000,100000', help='TrainingLogの行数（カンマ区切り）')
+    parser.add_argument('--program-rows', type=int, default=600)
+    parser.add_argument('--latency', type=float, default=0.0, help='API呼び出し1回あたりの遅延（秒）')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--baseline', help='比較する前回の結果JSON')
+    args = parser.parse_args()
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'latency_s': args.latency,
+        'program_rows': args.program_rows,
+        'results': {},
+    }
+    for size in [int(value) for value in args.sizes.split(',')]:
+        report['results'][str(size)] = run_size(size, args.program_rows, args.latency, args.repeat)
+
+    baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8')) if args.baseline else None
+    print_results(report, baseline)
+    Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"\n結果を {args.output} に書き出しました")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import pandas as pd
+from training_log import make_log_rows, parse_loads
+
+# コーチ一括入力の表の列（1行が1人の1セット）
+GRID_COLUMNS = ['選手', 'No', 'エクササイズ名', 'set', '負荷', '回数']
+
+def _split(text):
+    return [part.strip() for part in str(text).split('・')]
+
+def _to_int(text):
+    try:
+        return int(float(text))
+    except (TypeError, ValueError):
+        return None
+
+def plan_sets(exercise):
+    """まとめた種目の予定（'・'区切りのset・load_display・rep）を1セットずつの (負荷, 回数) に展開"""
+    loads, reps = _split(exercise['load_display']), _split(exercise['rep'])
+    planned = []
+    for i, count in enumerate(_split(exercise['set'])):
+        load = loads[i] if i < len(loads) else ''
+        rep = _to_int(reps[i]) if i < len(reps) else None
+        planned += [('' if load in ('-', 'nan') else load, rep)] * max(_to_int(count) or 1, 1)
+    return planned
+
+def build_entry_grid(players, exercises):
+    """選手×種目×セットの入力表をプログラムの予定で埋めて作る"""
+    rows = [
+        [player, exercise.get('No', ''), exercise['Exercise'], set_number, load, rep]
+        for player in players
+        for exercise in exercises
+        for set_number, (load, rep) in enumerate(plan_sets(exercise), start=1)
+    ]
+    grid = pd.DataFrame(rows, columns=GRID_COLUMNS)
+    return grid.astype({'set': 'Int64', '回数': 'Int64'})
+
+def latest_body_weights(df, players):
+    """選手ごとの直近の体重（記録が無い選手は含めない）"""
+    if len(df) == 0 or not players:
+        return {}
+    rows = df.loc[df['名前'].isin(players) & df['体重'].notna(), ['名前', '日付', '体重']]
+    latest = rows.sort_values('日付', kind='stable').groupby('名前', observed=True)['体重'].last()
+    # 体重はfloat32で持っているので、入力どおりの0.1kg単位に戻す（70.1 → 70.0999984...にしない）
+    return {name: round(float(weight), 1) for name, weight in latest.items()}
+
+def validate_entry_grid(grid, body_weights=None):
+    """入力表を確認し、(保存できる行のDataFrame, エラーメッセージのリスト) を返す
+
+    空の行は無視する。選手・種目・set（1以上の整数）・負荷（60kg / 70% / 体重 /
+    体重+10kg などの書式）・回数（0以上の整数）が揃っていない行はエラーにする。
+    body_weightsは {選手: 体重} で、負荷が体重の行はこれで総負荷量を計算する。
+    """
+    body_weights = body_weights or {}
+    grid = grid.reset_index(drop=True)
+    text = grid[['選手', 'エクササイズ名', '負荷']].astype('string').fillna('').apply(lambda column: column.str.strip())
+    is_blank = (text == '').all(axis=1) & grid['回数'].isna()
+    sets = pd.to_numeric(grid['set'], errors='coerce')
+    reps = pd.to_numeric(grid['回数'], errors='coerce')
+    weights = text['選手'].map(lambda name: body_weights.get(name))
+    parsed = parse_loads(text['負荷'], weights)
+
+    valid_sets = (sets >= 1) & (sets == sets.round())
+    valid_reps = (reps >= 0) & (reps == reps.round())
+    problems = {
+        '選手名がありません': text['選手'] == '',
+        '種目がありません': text['エクササイズ名'] == '',
+        'setは1以上の整数で入力してください': ~valid_sets,
+        '負荷の書式が正しくありません（例: 60kg, 70%, 体重, 体重+10kg）': (parsed['unit'] == '') & parsed['value'].isna() | (text['負荷'] == ''),
+        '体重が未入力の選手です': parsed['bodyweight'] & weights.isna(),
+        '回数は0以上の整数で入力してください': ~valid_reps,
+    }
+    errors = []
+    for row in grid.index[~is_blank]:
+        messages = [message for message, failed in problems.items() if failed[row]]
+        if messages:
+            errors.append(f"{row + 1}行目（{text['選手'][row] or '-'} / {text['エクササイズ名'][row] or '-'}）: {'、'.join(messages)}")
+    entries = grid[~is_blank].assign(
+        選手=text['選手'], エクササイズ名=text['エクササイズ名'], 負荷=text['負荷'],
+        # 整数でない値（エラーの行）は欠損にしてから整数型にする
+        set=sets.where(valid_sets).astype('Int64'), 回数=reps.where(valid_reps).astype('Int64'), 体重=weights,
+    )
+    return entries, errors
+
+def grid_log_rows(entries, program_name, date, exercise_types):
+    """確認済みの入力表から保存する行を作る（CategoryはexerciseのType: {種目: Type}）"""
+    return make_log_rows(
+        date, program_name, entries['選手'], [weight if pd.notna(weight) else None for weight in entries['体重']],
+        entries['エクササイズ名'], [exercise_types.get(name, '') for name in entries['エクササイズ名']], [int(value) for value in entries['set']],
+        entries['負荷'], [int(value) for value in entries['回数']],
+    )
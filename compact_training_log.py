@@ -0,0 +1,41 @@
+"""古い月別TrainingLogシートを圧縮ファイル（Parquet/zstd）に移すツール
+
+アプリと同じ .streamlit/secrets.toml の認証情報を使う。--deleteを付けない限り
+シートは残すので、まず付けずに実行して training_log_archive/ の中身を確認する。
+
+    python compact_training_log.py --keep-months 12
+    python compact_training_log.py --keep-months 12 --include-legacy --delete
+"""
+import argparse
+import tomllib
+from pathlib import Path
+import gspread
+from oauth2client.service_account import ServiceAccountCredentials
+from partitions import compact_partitions
+from sheets_client import SheetsHandlePool
+
+ROOT = Path(__file__).resolve().parent
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keep-months', type=int, default=12, help='シートに残す月数（当月を含む）')
+    parser.add_argument('--archive-dir', default=str(ROOT / "training_log_archive"))
+    parser.add_argument('--secrets', default=str(ROOT / ".streamlit" / "secrets.toml"))
+    parser.add_argument('--include-legacy', action='store_true', help='旧来のTrainingLogシートも月ごとに保存する')
+    parser.add_argument('--delete', action='store_true', help='保存を確認できたシートを削除する')
+    args = parser.parse_args()
+
+    secrets = tomllib.loads(Path(args.secrets).read_text(encoding='utf-8'))
+    scope = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+    credentials = ServiceAccountCredentials.from_json_keyfile_dict(dict(secrets["gcp_service_account"]), scope)
+    client = gspread.authorize(credentials)
+    pool = SheetsHandlePool(lambda: client, secrets["spreadsheet_url"])
+
+    archived = compact_partitions(pool, args.archive_dir, args.keep_months, include_legacy=args.include_legacy, delete=args.delete)
+    for title, count in archived.items():
+        print(f"{title}: {count}行 {'→ 削除' if args.delete else '（シートは残しています）'}")
+    if not archived:
+        print("対象のシートはありません")
+
+if __name__ == '__main__':
+    main()
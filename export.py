@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+import pandas as pd
+
+# 形式ごとの (拡張子, MIMEタイプ)
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+}
+
+def filter_training_log(df, start_date=None, end_date=None, players=None, types=None, programs=None):
+    """期間（両端を含む）・選手・Type・プログラムで絞り込む（空の条件は絞り込まない）"""
+    mask = pd.Series(True, index=df.index)
+    if start_date is not None:
+        mask &= df['日付'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= df['日付'] < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    if players:
+        mask &= df['名前'].isin(players)
+    if types:
+        mask &= df['Category'].isin(types)
+    if programs:
+        mask &= df['プログラム名'].isin(programs)
+    return df[mask]
+
+def iter_csv_chunks(df, chunk_rows=20000):
+    """CSV（BOM付きUTF-8）をchunk_rows行ずつのバイト列で返す"""
+    yield df.head(0).to_csv(index=False).encode('utf-8-sig')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode('utf-8')
+
+def write_export(df, path, fmt):
+    if fmt == 'CSV':
+        with open(path, 'wb') as f:
+            for chunk in iter_csv_chunks(df):
+                f.write(chunk)
+    elif fmt == 'Parquet':
+        df.to_parquet(path, index=False)
+    elif fmt == 'Excel':
+        df.to_excel(path, index=False, engine='openpyxl')
+    else:
+        raise ValueError(f"未対応の形式: {fmt}")
+
+class ExportCache:
+    """書き出したファイルを (絞り込み条件, データの版, 形式) ごとに保持する
+
+    ファイルはダウンロードボタンが押されたときに初めて作る。同じ条件・同じ版なら
+    作成済みのファイルを返し、max_filesを超えたら古いものから消す。
+    """
+
+    def __init__(self, directory=None, max_files=20):
+        self.directory = Path(directory or tempfile.mkdtemp(prefix="training_log_export_"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def path_for(self, filters, revision, fmt):
+        key = json.dumps([filters, revision, fmt], ensure_ascii=False, sort_keys=True, default=str)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return self.directory / f"{digest}.{EXPORT_FORMATS[fmt][0]}"
+
+    def get(self, df, filters, revision, fmt):
+        """絞り込み済みファイルのパスを返す（無ければdfを絞り込んで書き出す）"""
+        path = self.path_for(filters, revision, fmt)
+        with self._lock:
+            if path.exists():
+                os.utime(path)
+                return path
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            write_export(filter_training_log(df, **filters), tmp_path, fmt)
+            os.replace(tmp_path, path)
+            self._evict()
+        return path
+
+    def _evict(self):
+        files = sorted((p for p in self.directory.iterdir() if p.suffix != '.tmp'), key=lambda p: p.stat().st_mtime)
+        for old in files[:max(len(files) - self.max_files, 0)]:
+            old.unlink(missing_ok=True)
@@ -0,0 +1,258 @@
+"""認証なしで動くgspread互換の偽バックエンド
+
+書き込みキューや読み込み処理をローカルで確認するための最小実装。
+Client.open_by_url → Spreadsheet.worksheet → Worksheet の流れと、
+アプリが使うメソッド（get_all_values / batch_get / values_batch_get / append_rows / get_lastUpdateTime など）だけを持つ。
+synthetic_clientで合成のProgramsとTrainingLog（1千〜100万行）を用意できる。
+secretsに fake_sheets = { log_rows = 10000, latency = 0.2 } のように書くと
+アプリ自体もこのバックエンドで動く。
+"""
+import re
+import threading
+import time
+import gspread
+import numpy as np
+
+class _FakeResponse:
+    def __init__(self, status_code, message):
+        self.status_code = status_code
+        self.text = message
+        self._message = message
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': self._message, 'status': 'FAKE'}}
+
+def api_error(status_code, message="fake error"):
+    """指定したステータスのgspread.exceptions.APIErrorを作る"""
+    return gspread.exceptions.APIError(_FakeResponse(status_code, message))
+
+def _parse_a1(a1_range):
+    """'A2:J' / 'A2:J10' / '1:1' を (開始行, 終了行or None, 開始列, 終了列or None) に変換（1始まり）"""
+    def col_number(letters):
+        number = 0
+        for char in letters:
+            number = number * 26 + ord(char) - 64
+        return number
+    a1_range = a1_range.split('!')[-1]
+    start, _, end = a1_range.partition(':')
+    start_match = re.fullmatch(r'([A-Z]*)(\d*)', start)
+    end_match = re.fullmatch(r'([A-Z]*)(\d*)', end or start)
+    start_row = int(start_match.group(2)) if start_match.group(2) else 1
+    end_row = int(end_match.group(2)) if end_match.group(2) else None
+    start_col = col_number(start_match.group(1)) if start_match.group(1) else 1
+    end_col = col_number(end_match.group(1)) if end_match.group(1) else None
+    return start_row, end_row, start_col, end_col
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows=None):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = len(spreadsheet._worksheets)
+        self._rows = [list(row) for row in (rows or [])]
+
+    def _call(self, kind):
+        self.spreadsheet.client._before_call(kind)
+
+    def get_all_values(self, **kwargs):
+        self._call('read')
+        with self.spreadsheet.client._lock:
+            width = max((len(row) for row in self._rows), default=0)
+            return [row + [''] * (width - len(row)) for row in self._rows]
+
+    def _values(self, a1_range):
+        start_row, end_row, start_col, end_col = _parse_a1(a1_range)
+        rows = self._rows[start_row - 1:end_row]
+        values = [row[start_col - 1:end_col] for row in rows]
+        # Sheets APIと同じく末尾の空セル・空行は返さない
+        values = [_strip(row) for row in values]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def get_values(self, a1_range=None, **kwargs):
+        self._call('read')
+        with self.spreadsheet.client._lock:
+            return self._values(a1_range) if a1_range else [list(row) for row in self._rows]
+
+    def batch_get(self, ranges, **kwargs):
+        self._call('read')
+        with self.spreadsheet.client._lock:
+            return [self._values(a1_range) for a1_range in ranges]
+
+    def append_rows(self, values, **kwargs):
+        self._call('write')
+        with self.spreadsheet.client._lock:
+            start = len(self._rows) + 1
+            self._rows.extend([str(value) for value in row] for row in values)
+            end = len(self._rows)
+            self.spreadsheet.touch()
+        return {'updates': {'updatedRange': f"{self.title}!A{start}:J{end}", 'updatedRows': len(values)}}
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], **kwargs)
+
+    def insert_row(self, values, index=1, **kwargs):
+        self._call('write')
+        with self.spreadsheet.client._lock:
+            self._rows.insert(index - 1, [str(value) for value in values])
+            self.spreadsheet.touch()
+
+    @property
+    def row_count(self):
+        return len(self._rows)
+
+def _strip(row):
+    row = list(row)
+    while row and row[-1] == '':
+        row.pop()
+    return row
+
+class FakeSpreadsheet:
+    def __init__(self, client, title="Fake Training Sheets"):
+        self.client = client
+        self.title = title
+        self.id = 'fake-spreadsheet'
+        self._worksheets = {}
+        self.modified_time = time.time()
+
+    def touch(self):
+        self.modified_time = max(time.time(), self.modified_time + 0.001)
+
+    def get_lastUpdateTime(self):
+        """Drive APIのmodifiedTime相当（RFC 3339の文字列）"""
+        self.client._before_call('drive')
+        return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(self.modified_time)) + f".{int(self.modified_time * 1000) % 1000:03d}Z"
+
+    def worksheet(self, title):
+        self.client._before_call('read')
+        if title not in self._worksheets:
+            raise gspread.WorksheetNotFound(title)
+        return self._worksheets[title]
+
+    def worksheets(self):
+        self.client._before_call('read')
+        return list(self._worksheets.values())
+
+    def add_worksheet(self, title, rows=1000, cols=26, **kwargs):
+        self.client._before_call('write')
+        worksheet = FakeWorksheet(self, title)
+        self._worksheets[title] = worksheet
+        self.touch()
+        return worksheet
+
+    def del_worksheet(self, worksheet):
+        self.client._before_call('write')
+        self._worksheets.pop(worksheet.title, None)
+        self.touch()
+
+    def values_batch_get(self, ranges, params=None, **kwargs):
+        self.client._before_call('read')
+        value_ranges = []
+        with self.client._lock:
+            for a1_range in ranges:
+                title, _, cells = a1_range.rpartition('!') if '!' in a1_range else (a1_range, '', '')
+                title = title.strip("'").replace("''", "'")
+                if title not in self._worksheets:
+                    raise api_error(400, f"Unable to parse range: {a1_range}")
+                worksheet = self._worksheets[title]
+                values = worksheet._values(cells) if cells else worksheet._values(f"A1:{len(worksheet._rows) or 1}")
+                value_ranges.append({'range': a1_range, 'majorDimension': 'ROWS', 'values': values})
+        return {'spreadsheetId': self.id, 'valueRanges': value_ranges}
+
+    def set_rows(self, title, rows):
+        """ワークシートの中身を直接設定する（API呼び出しとして数えない）"""
+        worksheet = self._worksheets.get(title) or FakeWorksheet(self, title)
+        worksheet._rows = [list(row) for row in rows]
+        self._worksheets[title] = worksheet
+        self.touch()
+        return worksheet
+
+class FakeClient:
+    """遅延と失敗を注入できる偽のgspreadクライアント
+
+    latency: 1回のAPI呼び出しごとの待ち時間（秒）
+    fail_next(n, status): 次のn回の呼び出しを指定ステータスのAPIErrorで失敗させる
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = {'read': 0, 'write': 0, 'drive': 0}
+        self._failures = []
+        self._lock = threading.RLock()
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def fail_next(self, count=1, status=429, kinds=('read', 'write')):
+        self._failures.extend([(status, kinds)] * count)
+
+    def _before_call(self, kind):
+        with self._lock:
+            self.calls[kind] += 1
+            if self._failures and kind in self._failures[0][1]:
+                status, _ = self._failures.pop(0)
+                raise api_error(status, f"fake {kind} failure")
+        if self.latency:
+            time.sleep(self.latency)
+
+    def open_by_url(self, url):
+        self._before_call('read')
+        return self.spreadsheet
+
+    def open_by_key(self, key):
+        return self.open_by_url(key)
+
+# ---- 合成データ ----
+
+TRAINING_LOG_HEADER = ["日付", "プログラム名", "名前", "体重", "エクササイズ名", "Category", "set", "負荷", "回数", "総負荷量"]
+PROGRAMS_HEADER = ["Category", "Program", "No", "Exercise", "Type", "set", "load", "rep", "Point"]
+_EXERCISES = [
+    ("Back Squat", "Lower"), ("Bench Press", "Upper"), ("Deadlift", "Lower"), ("Power Clean", "Power"),
+    ("Pull Up", "Upper"), ("Box Jump", "Power"), ("Plank", "Core"), ("Split Squat", "Lower"),
+    ("Overhead Press", "Upper"), ("Med Ball Throw", "Power"), ("Dead Bug", "Core"), ("RDL", "Lower"),
+]
+_WARMUPS = [("WU", "Jog"), ("ST", "Hip Stretch"), ("PL", "Pogo Jump")]
+
+def synthetic_training_log(rows, players=15, seed=0):
+    """TrainingLogシートの合成データ（ヘッダー込みの文字列の行）"""
+    rng = np.random.default_rng(seed)
+    names = np.array([f"選手{i + 1:02d}" for i in range(players)], dtype=object)
+    dates = (np.datetime64('2024-04-01') + np.sort(rng.integers(0, 900, rows))).astype(str)
+    exercise_idx = rng.integers(0, len(_EXERCISES), rows)
+    exercises = np.array([name for name, _ in _EXERCISES], dtype=object)[exercise_idx]
+    categories = np.array([category for _, category in _EXERCISES], dtype=object)[exercise_idx]
+    weights = rng.uniform(55, 100, players).round(1)
+    player_idx = rng.integers(0, players, rows)
+    load_kg = (rng.integers(8, 60, rows) * 2.5)
+    kind = rng.choice(['kg', '%', '体重'], rows, p=[0.8, 0.1, 0.1])
+    reps = rng.integers(1, 12, rows)
+    loads = np.where(kind == 'kg', np.char.add(load_kg.astype(str), 'kg'), np.where(kind == '%', '70.0%', '体重')).astype(object)
+    totals = np.where(kind == 'kg', load_kg * reps, np.where(kind == '体重', weights[player_idx] * reps, 0.0))
+    columns = [
+        dates.astype(object), np.array([f"P{i:03d}" for i in rng.integers(1, 40, rows)], dtype=object), names[player_idx],
+        weights[player_idx].astype(str).astype(object), exercises, categories, rng.integers(1, 6, rows).astype(str).astype(object),
+        loads, reps.astype(str).astype(object), totals.round(1).astype(str).astype(object),
+    ]
+    return [TRAINING_LOG_HEADER] + [list(row) for row in zip(*columns)]
+
+def synthetic_programs(rows, seed=0):
+    """Programsシートの合成データ（1プログラム=ウォームアップ3行+メイン6種目×2行）"""
+    rng = np.random.default_rng(seed)
+    values = [PROGRAMS_HEADER]
+    program_number = 0
+    while len(values) - 1 < rows:
+        program_number += 1
+        category = ['U18', 'U15', 'Personal'][program_number % 3]
+        program = f"P{program_number:03d}"
+        for no, exercise in _WARMUPS:
+            values.append([category, program, no, exercise, '', '1', '-', '10', ''])
+        for number, index in enumerate(rng.choice(len(_EXERCISES), 6, replace=False), start=1):
+            exercise, exercise_type = _EXERCISES[index]
+            for load in ('0.7', '0.8'):
+                values.append([category, program, str(number), exercise, exercise_type, str(rng.integers(2, 4)), load, str(rng.integers(3, 8)), 'フォーム重視'])
+    return values[:rows + 1]
+
+def synthetic_client(log_rows=1000, program_rows=300, latency=0.0, seed=0):
+    """合成のProgramsとTrainingLogを持つFakeClientを作る"""
+    client = FakeClient(latency=latency)
+    client.spreadsheet.set_rows("Programs", synthetic_programs(program_rows, seed))
+    client.spreadsheet.set_rows("TrainingLog", synthetic_training_log(log_rows, seed=seed))
+    return client
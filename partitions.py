@@ -0,0 +1,397 @@
+import itertools
+import os
+import re
+import threading
+import time
+import weakref
+from datetime import date
+from pathlib import Path
+import pandas as pd
+from training_log import TRAINING_LOG_COLUMNS, TrainingLogSync, build_latest_session_index, concat_training_logs, empty_training_log, range_start_row, type_training_log
+
+# 旧来の単一シート（月別シート導入前のデータ）
+LEGACY_TITLE = "TrainingLog"
+# 月別シート TrainingLog_2026_10 と、圧縮済みファイル TrainingLog_2026_10.parquet / TrainingLog_2026_10_legacy.parquet
+_MONTH_PATTERN = re.compile(r'^TrainingLog_(\d{4})_(\d{2})(?:_legacy)?$')
+
+def partition_title(day):
+    """日付が属する月のワークシート名（例: TrainingLog_2026_10）"""
+    day = pd.Timestamp(day)
+    return f"TrainingLog_{day.year:04d}_{day.month:02d}"
+
+def partition_month(title):
+    """ワークシート名・アーカイブ名から (年, 月) を返す（月別でなければNone）"""
+    match = _MONTH_PATTERN.match(title)
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+def months_before(day, months):
+    """dayの月からmonths-1か月前の (年, 月)（months=1なら当月）"""
+    index = day.year * 12 + day.month - 1 - (months - 1)
+    return index // 12, index % 12 + 1
+
+def route_row(row):
+    """保存する行（A列が日付）の書き込み先ワークシート名"""
+    try:
+        return partition_title(row[0])
+    except (ValueError, TypeError):
+        return partition_title(date.today())
+
+class PartitionedTrainingLog:
+    """月別ワークシートに分かれたTrainingLogをまとめて読むリーダー
+
+    パーティションごとにTrainingLogSyncを持ち、require()で指定した月以降だけを
+    読み込む（一度読み込んだ月はその後も更新の対象）。書き込みが続くのは当月の
+    シートだけなので、当月以外はcold_max_ageごとにしか読み直さない。旧来の
+    TrainingLogシートが残っていれば常に読み込み、archive_dirに圧縮済みの月が
+    あれば対象の月だけをそこから読む。
+    リスナーには結合後のログについて ('reset', 全体) / ('append', 追記分) を通知する。
+    seed()で渡した前回のスナップショットは、最初にシートを読み込めるまでの代わりに使う。
+    Sheetsの読み込みは_refresh_lock（読み込み同士の順番待ち）だけを持って行い、_lockは
+    読み込んだパーティションを入れ替える間だけ持つので、読み込み中もdfなどはすぐ返る。
+    """
+
+    def __init__(self, pool, archive_dir=None, cold_max_age=600, titles_max_age=600):
+        self._pool = pool
+        self._archive_dir = Path(archive_dir) if archive_dir else None
+        self.cold_max_age = cold_max_age
+        self.titles_max_age = titles_max_age
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.RLock()
+        self._local = threading.local()
+        self._syncs = {}
+        self._archived = {}
+        self._archived_index = {}
+        self._since = None
+        self._load_all = False
+        # 最後に読み込みを終えた時点の対象範囲（require()はこれで足りていれば何もしない）
+        self._loaded_since = None
+        self._loaded_all = False
+        self._titles = None
+        self._titles_at = 0.0
+        self._df = None
+        self._df_revision = None
+        self._seed = None
+        self._seed_index = {}
+        # パーティションの変更ごとに進める（next()はスレッド間でも重複しない）
+        self._changes = itertools.count(1)
+        self.revision = 0
+        self.listeners = []
+        self.listener_error = None
+
+    # ---- 対象のパーティション ----
+
+    def _wanted(self, title):
+        if title == LEGACY_TITLE:
+            return True
+        month = partition_month(title)
+        if month is None:
+            return False
+        return self._load_all or (self._since is not None and month >= self._since)
+
+    def _sheet_titles(self):
+        if self._titles is None or time.time() - self._titles_at > self.titles_max_age:
+            self._titles = set(self._pool.worksheet_titles())
+            self._titles_at = time.time()
+        return {title for title in self._titles if title == LEGACY_TITLE or partition_month(title)}
+
+    def _archive_titles(self):
+        if self._archive_dir is None or not self._archive_dir.is_dir():
+            return []
+        return [path.stem for path in self._archive_dir.glob("TrainingLog_*.parquet") if partition_month(path.stem)]
+
+    def covers(self, since=None):
+        """since=(年, 月) 以降（Noneなら全期間）が対象に入っているか"""
+        return self._load_all or (since is not None and self._since is not None and since >= self._since)
+
+    def _loaded(self, since):
+        return self._loaded_all or (since is not None and self._loaded_since is not None and since >= self._loaded_since)
+
+    def scope(self):
+        """対象の範囲（全期間ならNone）"""
+        return None if self._load_all else self._since
+
+    @property
+    def seeded(self):
+        """シートの代わりにスナップショットを返している間はTrue"""
+        return self._seed is not None
+
+    def seed(self, df, since=None):
+        """前回保存したログ（since以降、Noneなら全期間）を読み込み前の内容として使う"""
+        with self._lock:
+            if self._syncs:
+                return
+            self._seed = df
+            self._seed_index = build_latest_session_index(df)
+            if since is None:
+                self._load_all = True
+            elif self._since is None or since < self._since:
+                self._since = since
+            self.revision = next(self._changes)
+
+    def _widen(self, since):
+        with self._lock:
+            if since is None:
+                self._load_all = True
+            elif self._since is None or since < self._since:
+                self._since = since
+
+    def require(self, since=None):
+        """since=(年, 月) 以降（Noneなら全期間）を対象に加え、新しく対象になった分を読み込む"""
+        if self._loaded(since):
+            # 読み込み済みの範囲ならロックを取らずに返す（裏の更新を待たない）
+            return
+        self._widen(since)
+        self.refresh(new_only=True)
+
+    def preload(self, since, fetch_values):
+        """require()と同じだが、まだ読んでいないパーティションをまとめて1回で読む（起動時用）
+
+        fetch_values(シート名のリスト) は {シート名: get_all_values()と同じ形の値} を返す。
+        返らなかったシートは通常どおり1枚ずつ読む。
+        """
+        self._widen(since)
+        with self._refresh_lock:
+            titles = [title for title in sorted(self._sheet_titles()) if self._wanted(title) and title not in self._syncs]
+            return self.refresh(new_only=True, prefetched=fetch_values(titles))
+
+    # ---- 読み込み ----
+
+    def _is_current(self, title):
+        return title == partition_title(date.today())
+
+    def is_fresh(self, max_age):
+        # 各パーティションの最終読み込み時刻を見るだけなのでロックは取らない
+        syncs = list(self._syncs.items())
+        if not syncs:
+            return False
+        return all(sync.is_fresh(max_age if self._is_current(title) else self.cold_max_age) for title, sync in syncs)
+
+    def mark_stale(self):
+        with self._lock:
+            for sync in self._syncs.values():
+                sync.mark_stale()
+
+    def refresh(self, max_age=0, new_only=False, prefetched=None):
+        """対象のパーティションを読み込む（当月はmax_age、それ以外はcold_max_ageを過ぎたものだけ）
+
+        prefetchedは {シート名: 値}（既に読んであるシートはそこから取り込む）。
+        新しいパーティションはロックの外で読み込んでから、_lockの中で入れ替える。
+        """
+        import gspread
+        prefetched = prefetched or {}
+        with self._refresh_lock:
+            self._local.events = []
+            try:
+                sheet_titles = self._sheet_titles()
+                with self._lock:
+                    syncs = dict(self._syncs)
+                    wanted = [title for title in sorted(sheet_titles) if self._wanted(title)]
+                    loading_since, loading_all = self._since, self._load_all
+                dropped = [title for title in syncs if title not in sheet_titles]
+                added = {}
+                for title in wanted:
+                    sync = syncs.get(title)
+                    if sync is None:
+                        sync = added[title] = self._new_partition()
+                    elif sync.header is not None and (new_only or sync.is_fresh(max_age if self._is_current(title) else self.cold_max_age)):
+                        continue
+                    if title in prefetched:
+                        sync.load_values(prefetched[title])
+                        continue
+                    try:
+                        self._pool.with_worksheet(title, sync.refresh)
+                    except gspread.WorksheetNotFound:
+                        self._titles.discard(title)
+                        sheet_titles.discard(title)
+                        added.pop(title, None)
+                        if title in syncs:
+                            dropped.append(title)
+                archives = {}
+                for title in sorted(self._archive_titles()):
+                    # シートが残っている間はシートを正とする
+                    still_on_sheet = title in sheet_titles or (title.endswith('_legacy') and LEGACY_TITLE in sheet_titles)
+                    if self._wanted(title) and title not in self._archived and not still_on_sheet:
+                        archives[title] = self._read_archive(title)
+                with self._lock:
+                    for title in dropped:
+                        self._drop_partition(title)
+                    for title, sync in added.items():
+                        # 読み込み中に書き込みスレッドが作ったパーティションはシートを読んだ方で置き換える
+                        self._syncs[title] = sync
+                    for title, df in archives.items():
+                        self._add_archive(title, df)
+                    if self._seed is not None and self._syncs:
+                        # シートを読めたのでスナップショットはもう使わない
+                        self._seed = None
+                        self._seed_index = {}
+                        self._local.events.append(('reset', None))
+                    # 入れ替えた後の内容でdfを作り直させる
+                    self.revision = next(self._changes)
+                    if loading_all:
+                        self._loaded_all = True
+                    elif loading_since is not None and (self._loaded_since is None or loading_since < self._loaded_since):
+                        self._loaded_since = loading_since
+                events = self._local.events
+            finally:
+                self._local.events = None
+            if added or any(kind == 'reset' for kind, _ in events):
+                self._notify('reset', self.df)
+            else:
+                for kind, df in events:
+                    self._notify(kind, df)
+            return self.df
+
+    def _new_partition(self):
+        sync = TrainingLogSync()
+        sync.listeners.append(lambda kind, df: self._on_partition_change(kind, df))
+        return sync
+
+    def _add_partition(self, title):
+        sync = self._syncs[title] = self._new_partition()
+        return sync
+
+    def _drop_partition(self, title):
+        # 他のプロセスが圧縮して削除したシート（以降はアーカイブから読む）
+        self._syncs.pop(title, None)
+        self.revision = next(self._changes)
+        self._local.events.append(('reset', None))
+
+    def _read_archive(self, title):
+        raw = pd.read_parquet(self._archive_dir / f"{title}.parquet")
+        return type_training_log(raw) if len(raw) > 0 else empty_training_log()
+
+    def _add_archive(self, title, df):
+        self._archived[title] = df
+        self._archived_index[title] = build_latest_session_index(df)
+        self.revision = next(self._changes)
+        self._local.events.append(('reset', df))
+
+    def _on_partition_change(self, kind, df):
+        self.revision = next(self._changes)
+        events = getattr(self._local, 'events', None)
+        if events is not None:
+            events.append((kind, df))
+        elif kind == 'reset':
+            self._notify('reset', self.df)
+        else:
+            self._notify('append', df)
+
+    def _notify(self, kind, df):
+        for listener in self.listeners:
+            try:
+                listener(kind, df)
+            except Exception as e:
+                self.listener_error = f"{type(e).__name__}: {str(e)[:80]}"
+
+    # ---- 参照 ----
+
+    @property
+    def df(self):
+        """読み込み済みの全パーティションを結合したログ（呼び出し側で変更しないこと）"""
+        revision = self.revision
+        if self._df is None or self._df_revision != revision:
+            frames = [frame for _, frame in sorted(self._frames(), key=lambda item: (item[0] != LEGACY_TITLE, partition_month(item[0]) or (0, 0)))]
+            self._df = concat_training_logs(frames)
+            self._df_revision = revision
+        return self._df
+
+    def _frames(self):
+        seed = self._seed
+        if seed is not None:
+            return [("snapshot", seed)]
+        return [(title, sync.df) for title, sync in list(self._syncs.items())] + list(self._archived.items())
+
+    def latest_session(self, player_name, exercise_name):
+        """全パーティションのうち最も新しいセッションの概要（記録が無ければNone）"""
+        key = (player_name, exercise_name)
+        candidates = [sync.latest_index.get(key) for sync in list(self._syncs.values())]
+        candidates += [index.get(key) for index in list(self._archived_index.values())]
+        if self._seed is not None:
+            candidates = [self._seed_index.get(key)]
+        candidates = [summary for summary in candidates if summary is not None]
+        return max(candidates, key=lambda summary: summary['date']) if candidates else None
+
+    def merge_written(self, title, rows, updated_range=None):
+        """書き込みスレッドが送った行を該当パーティションに反映する"""
+        with self._lock:
+            if self._titles is not None:
+                self._titles.add(title)
+            sync = self._syncs.get(title)
+            if sync is None:
+                if not self._wanted(title):
+                    return False
+                sync = self._add_partition(title)
+                if range_start_row(updated_range) == 2:
+                    # ヘッダーだけの新しい月のシートへの書き込み（次回の差分読み込みでヘッダーも確認する）
+                    sync.header = list(TRAINING_LOG_COLUMNS)
+        return sync.merge_written(rows, updated_range)
+
+# ヘッダーを確かめ済みの月別シート（プールごと）
+_checked_partitions = weakref.WeakKeyDictionary()
+
+def get_partition_worksheet(pool, title):
+    """月別シートを返す（無ければヘッダー付きで作る）
+
+    シートの作成とヘッダーの書き込みは別の呼び出しなので、ヘッダーだけ書けずに
+    残ったシートもありうる。このプロセスで初めて使うときに1行目を確かめ、
+    ヘッダーが無ければ先頭に書いてから返す。
+    """
+    import gspread
+    try:
+        worksheet = pool.worksheet(title)
+    except gspread.WorksheetNotFound:
+        worksheet = pool.add_worksheet(title=title, rows="1000", cols=str(len(TRAINING_LOG_COLUMNS)))
+    checked = _checked_partitions.setdefault(pool, set())
+    if title not in checked:
+        first_row = worksheet.get_values('1:1')
+        if not first_row or not first_row[0]:
+            worksheet.append_row(TRAINING_LOG_COLUMNS)
+        elif first_row[0][0] != TRAINING_LOG_COLUMNS[0]:
+            # データ行が先頭にある（ヘッダーの書き込みに失敗した後に追記された）
+            worksheet.insert_row(TRAINING_LOG_COLUMNS, 1)
+        checked.add(title)
+    return worksheet
+
+def _write_archive(values, path):
+    header, rows = (values[0], values[1:]) if values else (TRAINING_LOG_COLUMNS, [])
+    frame = pd.DataFrame(rows, columns=header).astype(str)
+    tmp_path = path.with_name(path.name + '.tmp')
+    frame.to_parquet(tmp_path, index=False, compression='zstd')
+    if len(pd.read_parquet(tmp_path)) != len(frame):
+        tmp_path.unlink(missing_ok=True)
+        raise RuntimeError(f"{path.name}の書き出しを確認できませんでした")
+    os.replace(tmp_path, path)
+    return len(frame)
+
+def compact_partitions(pool, archive_dir, keep_months=12, include_legacy=False, delete=False, today=None):
+    """keep_monthsより古い月別シートをarchive_dirの圧縮ファイル（Parquet/zstd）に移す
+
+    include_legacy=Trueなら旧来のTrainingLogシートも月ごとに分けて保存する。
+    delete=Trueの場合だけ、保存と読み戻しの確認ができたシートを削除する。
+    {シート名: 保存した行数} を返す。
+    """
+    archive_dir = Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    cutoff = months_before(today or date.today(), keep_months)
+    archived = {}
+    for title in sorted(pool.worksheet_titles()):
+        month = partition_month(title)
+        if title == LEGACY_TITLE and include_legacy:
+            values = pool.with_worksheet(title, lambda worksheet: worksheet.get_all_values())
+            header = values[0] if values else TRAINING_LOG_COLUMNS
+            by_month = {}
+            for row in values[1:]:
+                try:
+                    key = partition_title(row[0])
+                except (ValueError, TypeError):
+                    key = "TrainingLog_0000_00"
+                by_month.setdefault(key, []).append(row)
+            archived[title] = sum(_write_archive([header] + rows, archive_dir / f"{key}_legacy.parquet") for key, rows in by_month.items())
+        elif month is not None and month < cutoff:
+            values = pool.with_worksheet(title, lambda worksheet: worksheet.get_all_values())
+            archived[title] = _write_archive(values, archive_dir / f"{title}.parquet")
+        else:
+            continue
+        if delete:
+            pool.delete_worksheet(title)
+    return archived
@@ -0,0 +1,139 @@
+import json
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+# 実行中の再実行の計測（Streamlitはスクリプトを実行するスレッドごとに持つ）
+_current = threading.local()
+
+@contextmanager
+def span(name):
+    """現在の再実行に区間を記録する（計測中でなければ何もしない）"""
+    trace = getattr(_current, 'trace', None)
+    if trace is None:
+        yield
+        return
+    trace.enter(name)
+    try:
+        yield
+    finally:
+        trace.exit()
+
+class RerunTrace:
+    """1回の再実行の計測
+
+    spansには区間ごとの自分だけの時間（入れ子の子区間を除く）を積算する。
+    どの区間にも入らない時間は'render'（画面描画・その他）として扱う。
+    """
+
+    def __init__(self, session_id, page=None):
+        self.session_id = session_id
+        self.page = page
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._stack = []
+        self.spans = {}
+        self.counts = {}
+        self.last_activity = self._start
+
+    def enter(self, name):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, child_time = self._stack.pop()
+        now = time.perf_counter()
+        elapsed = now - start
+        self.spans[name] = self.spans.get(name, 0.0) + elapsed - child_time
+        self.counts[name] = self.counts.get(name, 0) + 1
+        if self._stack:
+            self._stack[-1][2] += elapsed
+        self.last_activity = now
+
+    def to_record(self, end, status):
+        total = end - self._start
+        spans = {name: round(seconds * 1000, 1) for name, seconds in self.spans.items()}
+        spans['render'] = round(max(total - sum(self.spans.values()), 0.0) * 1000, 1)
+        return {
+            'ts': datetime.fromtimestamp(self.started_at).isoformat(timespec='milliseconds'),
+            'session': self.session_id,
+            'page': self.page,
+            'status': status,
+            'total_ms': round(total * 1000, 1),
+            'spans': spans,
+            'calls': dict(self.counts),
+        }
+
+def _json_logger():
+    logger = logging.getLogger("sunrockers.perf")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+class PerfRecorder:
+    """全セッションの再実行の計測を直近history件まで保持し、JSONの1行ログにも出す
+
+    st.stop()やst.rerun()で最後まで走らなかった再実行は、同じセッションの
+    次の再実行の開始時に最後の区間の終了時点で締める（status='stopped'）。
+    """
+
+    def __init__(self, history=200, logger=None):
+        self.records = deque(maxlen=history)
+        self._open = {}
+        self._lock = threading.Lock()
+        self._logger = logger or _json_logger()
+
+    def begin(self, session_id, page=None):
+        with self._lock:
+            leftover = self._open.pop(session_id, None)
+        if leftover is not None:
+            self._close(leftover, leftover.last_activity, 'stopped')
+        trace = RerunTrace(session_id, page)
+        with self._lock:
+            self._open[session_id] = trace
+        _current.trace = trace
+        return trace
+
+    def finish(self):
+        """このスレッドで計測中の再実行を締める"""
+        trace = getattr(_current, 'trace', None)
+        if trace is None:
+            return
+        _current.trace = None
+        with self._lock:
+            if self._open.get(trace.session_id) is trace:
+                del self._open[trace.session_id]
+        self._close(trace, time.perf_counter(), 'ok')
+
+    @contextmanager
+    def fragment_rerun(self, session_id, page=None):
+        """フラグメントだけの再実行を1回分として計測する（アプリ全体の再実行中なら何もしない）"""
+        if getattr(_current, 'trace', None) is not None:
+            yield
+            return
+        self.begin(session_id, page)
+        try:
+            yield
+        finally:
+            self.finish()
+
+    def _close(self, trace, end, status):
+        record = trace.to_record(end, status)
+        with self._lock:
+            self.records.append(record)
+        try:
+            self._logger.info(json.dumps(record, ensure_ascii=False))
+        except Exception:
+            pass
+
+    def recent(self, session_id=None, limit=20):
+        with self._lock:
+            records = [r for r in self.records if session_id is None or r['session'] == session_id]
+        return records[-limit:]
@@ -0,0 +1,244 @@
+import threading
+import time
+import pandas as pd
+from perf_trace import span
+
+WARMUP_NOS = ['WU', 'ST', 'PL']
+
+def programs_revision(program_df):
+    """Programsシートの内容から版を表すハッシュ値を作る"""
+    if len(program_df) == 0:
+        return '0'
+    hashed = pd.util.hash_pandas_object(program_df, index=False).sum()
+    return f"{len(program_df)}-{int(hashed)}-{'|'.join(program_df.columns)}"
+
+def fetch_programs(pool):
+    """Programsシートを読み込んで (DataFrame, 版) を返す"""
+    with span('sheet_fetch'):
+        data = pool.with_worksheet("Programs", lambda worksheet: worksheet.get_all_values())
+    return parse_programs(data)
+
+def parse_programs(data):
+    """Programsシートの値（get_all_values()と同じ形）を (DataFrame, 版) にする"""
+    with span('parse'):
+        if len(data) > 0:
+            df = pd.DataFrame(data[1:], columns=data[0])
+            if 'Type' not in df.columns:
+                df['Type'] = ''
+            if 'Category' not in df.columns:
+                df['Category'] = 'U18'
+        else:
+            df = pd.DataFrame()
+        return df, programs_revision(df)
+
+class ProgramsSource:
+    """Programsシートを変更があったときだけ全件読み込むローダー
+
+    全件を読む前に安い確認を1回だけ行う。version_range（例: 'Programs!K1'、
+    Programsを編集したら書き換える版番号や日時のセル）があればそのセルを、無ければ
+    スプレッドシートの更新時刻（Drive APIのmodifiedTime）を見て、前回の全件読み込み時と
+    同じなら前回の (DataFrame, 版) をそのまま返す。確認できなかった場合と
+    full_refresh_intervalを過ぎた場合は全件を読み、版（内容のハッシュ）が変わったときだけ
+    changesを数える。
+
+    更新時刻は同じスプレッドシートのTrainingLogへの書き込みでも変わるので、練習中は
+    ほぼ毎回変わる。version_rangeが無い場合は、更新時刻が変わっても前回の全件読み込みから
+    modified_time_interval秒たつまでは読み直さない（Programsの編集の反映もその分遅れる）。
+    すぐに反映したい場合はversion_rangeを設定すること（has_version_cellで確認できる）。
+    """
+
+    def __init__(self, pool, version_range=None, full_refresh_interval=3600, modified_time_interval=300):
+        self._pool = pool
+        self._version_range = version_range
+        self.full_refresh_interval = full_refresh_interval
+        self.modified_time_interval = modified_time_interval
+        self._lock = threading.Lock()
+        self._value = None
+        self._marker = None
+        self._fetched_at = 0.0
+        self.checks = 0
+        self.full_fetches = 0
+        self.changes = 0
+
+    @property
+    def has_version_cell(self):
+        return bool(self._version_range)
+
+    def marker(self):
+        """変更の目印（版のセルの値、または更新時刻）"""
+        with span('sheet_fetch'):
+            if self._version_range:
+                title, _, cell = self._version_range.rpartition('!')
+                return repr(self._pool.with_worksheet(title or "Programs", lambda worksheet: worksheet.get_values(cell)))
+            return self._pool.spreadsheet().get_lastUpdateTime()
+
+    def load(self):
+        with self._lock:
+            try:
+                marker = self.marker()
+            except Exception:
+                marker = None
+            self.checks += 1
+            if marker is not None and self._value is not None and time.time() - self._fetched_at < self.full_refresh_interval:
+                if marker == self._marker:
+                    return self._value
+                if not self._version_range and time.time() - self._fetched_at < self.modified_time_interval:
+                    # 更新時刻の変化はTrainingLogへの書き込みのことが多いので、間隔を空けて読み直す
+                    return self._value
+            return self._accept(fetch_programs(self._pool), marker)
+
+    def preload(self, data, marker=None):
+        """別の経路（起動時の一括読み込み）で読んだProgramsの値を取り込む
+
+        markerは読む前に取った変更の目印（Noneなら次のload()で全件を読み直す）。
+        """
+        with self._lock:
+            return self._accept(parse_programs(data), marker)
+
+    def _accept(self, value, marker):
+        program_df, revision = value
+        self.full_fetches += 1
+        if self._value is None or revision != self._value[1]:
+            self.changes += 1
+            self._value = (program_df, revision)
+        self._marker = marker
+        self._fetched_at = time.time()
+        return self._value
+
+def format_loads(loads):
+    """負荷の列を表示用に変換（1.0以下の小数は%表記）"""
+    loads = loads.astype(str)
+    is_fraction = loads.str.replace('.', '', regex=False).str.isdigit()
+    values = pd.to_numeric(loads.where(is_fraction), errors='coerce')
+    is_fraction = is_fraction & (values <= 1.0)
+    return loads.mask(is_fraction, (values * 100).map(lambda v: f"{v:.0f}%"))
+
+def _column_or_blank(df, column):
+    return df[column] if column in df.columns else pd.Series('', index=df.index)
+
+def _is_given(values):
+    return values.notna() & (values.astype(str) != '-')
+
+def compile_programs(program_df):
+    """Programsシート全体を入力ページ用のモデルにまとめる
+
+    {(Category, Program): {'exercises': [...], 'warmups': [...]}} を返す。
+    'exercises'は同名種目をまとめた行（set/load/repは'・'区切り、load_displayは
+    %表記済み、set_totalは予定セット数の合計）、'warmups'はWU/ST/PLの行と
+    表示用の詳細テキスト。全プログラムを1回のgroupbyで処理する。
+    """
+    if len(program_df) == 0:
+        return {}
+    df = program_df.assign(
+        No=_column_or_blank(program_df, 'No'),
+        Type=_column_or_blank(program_df, 'Type'),
+        Point=_column_or_blank(program_df, 'Point'),
+        load_display=format_loads(program_df['load']),
+        set_count=pd.to_numeric(program_df['set'], errors='coerce'),
+    )
+    is_warmup = df['No'].isin(WARMUP_NOS) if 'No' in program_df.columns else pd.Series(False, index=df.index)
+    compiled = {key: {'exercises': [], 'warmups': []} for key in df[['Category', 'Program']].drop_duplicates().itertuples(index=False, name=None)}
+
+    join = lambda values: '・'.join(map(str, values))
+    aggregations = {
+        'No': ('No', 'first'),
+        'set': ('set', join),
+        'load': ('load', join),
+        'rep': ('rep', join),
+        'Type': ('Type', 'first'),
+        'load_display': ('load_display', join),
+        'set_total': ('set_count', 'sum'),
+    }
+    if 'Point' in program_df.columns:
+        aggregations['Point'] = ('Point', 'first')
+    grouped = df[~is_warmup].groupby(['Category', 'Program', 'Exercise'], sort=False).agg(**aggregations).reset_index()
+    grouped['set_total'] = grouped['set_total'].clip(lower=1).astype(int)
+    for record in grouped.to_dict('records'):
+        key = (record.pop('Category'), record.pop('Program'))
+        compiled[key]['exercises'].append(record)
+
+    warmup = df[is_warmup]
+    if len(warmup) > 0:
+        set_text = (warmup['set'].astype(str) + 'セット').where(_is_given(warmup['set']), '')
+        rep_text = (warmup['rep'].astype(str) + 'レップ').where(_is_given(warmup['rep']), '')
+        load_text = warmup['load_display'].where(_is_given(warmup['load']), '')
+        for category, program, no, exercise, exercise_type, point, *details in zip(
+            warmup['Category'], warmup['Program'], warmup['No'], warmup['Exercise'], warmup['Type'], warmup['Point'],
+            set_text, rep_text, load_text,
+        ):
+            compiled[(category, program)]['warmups'].append({
+                'No': no,
+                'Exercise': exercise,
+                'Type': exercise_type,
+                'Point': point,
+                'detail_text': " / ".join(detail for detail in details if detail),
+            })
+    return compiled
+
+class ProgramCatalog:
+    """プログラム一覧ページ用の索引（Programsの版ごとに1回だけ作る）
+
+    カテゴリーごとのプログラム順・Type一覧と、エクササイズ名→プログラム、
+    (カテゴリー, Type)→プログラムの逆引き索引を持つ。各プログラムの表示用の表は
+    開かれたときに初めて作り、以降は使い回す。
+    """
+
+    def __init__(self, program_df):
+        self._df = program_df
+        self._tables = {}
+        self._programs = {}
+        self._types = {}
+        self._rows = {}
+        self._exercise_index = {}
+        self._type_index = {}
+        if len(program_df) == 0:
+            return
+        for (category, program), rows in program_df.groupby(['Category', 'Program'], sort=False).indices.items():
+            self._programs.setdefault(category, []).append(program)
+            self._rows[(category, program)] = rows
+        frame = program_df[['Category', 'Program', 'Exercise', 'Type']].drop_duplicates()
+        for category, program, exercise, exercise_type in frame.itertuples(index=False, name=None):
+            self._exercise_index.setdefault(str(exercise).lower(), {}).setdefault(category, set()).add(program)
+            if exercise_type != '' and pd.notna(exercise_type):
+                types = self._types.setdefault(category, [])
+                if exercise_type not in types:
+                    types.append(exercise_type)
+                self._type_index.setdefault((category, exercise_type), set()).add(program)
+
+    def programs(self, category):
+        return list(self._programs.get(category, []))
+
+    def types(self, category):
+        return list(self._types.get(category, []))
+
+    def search(self, category, programs=None, exercise_query='', type_filter=None):
+        """条件に合うプログラムを元の順で返す
+
+        exercise_queryはカンマ区切りで複数指定でき、いずれかを名前に含む
+        エクササイズ（大文字小文字は区別しない）があれば一致とする。
+        """
+        candidates = self.programs(category) if programs is None else list(programs)
+        terms = [term.strip().lower() for term in exercise_query.split(',') if term.strip()]
+        if terms:
+            matched = set()
+            for name, postings in self._exercise_index.items():
+                if category in postings and any(term in name for term in terms):
+                    matched |= postings[category]
+            candidates = [program for program in candidates if program in matched]
+        if type_filter is not None:
+            matched = self._type_index.get((category, type_filter), set())
+            candidates = [program for program in candidates if program in matched]
+        return candidates
+
+    def table(self, category, program):
+        """プログラムの表示内容 {'warmups': [(No, Exercise), ...], 'main': 文字列のDataFrame}"""
+        key = (category, program)
+        if key not in self._tables:
+            rows = self._df.iloc[self._rows.get(key, [])]
+            is_warmup = rows['No'].isin(WARMUP_NOS) if 'No' in rows.columns else pd.Series(False, index=rows.index)
+            main = rows[~is_warmup].reindex(columns=['No', 'Exercise', 'Type', 'set', 'load', 'rep']).astype(str)
+            main.columns = ['No.', 'エクササイズ', 'Type', 'セット数', '負荷', 'レップ数']
+            main.index = range(1, len(main) + 1)
+            warmup = rows[is_warmup]
+            self._tables[key] = {'warmups': list(zip(warmup['No'], warmup['Exercise'])), 'main': main}
+        return self._tables[key]
@@ -0,0 +1,241 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+import pandas as pd
+from analytics import CATEGORIES
+from export import filter_training_log
+
+# PDFの日本語フォント（Adobeの標準CIDフォントなのでフォントファイルは不要）
+REPORT_FONT = 'HeiseiKakuGo-W5'
+
+def period_label(period):
+    start, end = period
+    fmt = lambda value: pd.Timestamp(value).strftime('%Y/%m/%d') if value is not None else ''
+    return f"{fmt(start)} 〜 {fmt(end)}"
+
+def summarize_athletes(df, athletes):
+    """選手ごとのレポートの内容を全員分まとめて計算する
+
+    {選手: {'sessions': 実施日数, 'sets': セット数, 'volume': {Category: 総負荷量}, 'total': 総負荷量,
+    'latest': [[エクササイズ名, 日付, 負荷, 回数], ...]（種目ごとの直近のセッションの最終セット）}} を返す。
+    PDFを描くプロセスに渡すので、値はすべてpickleできる組み込み型にする。
+    """
+    summaries = {athlete: {'sessions': 0, 'sets': 0, 'volume': {}, 'total': 0.0, 'latest': []} for athlete in athletes}
+    rows = df[df['名前'].isin(athletes) & df['日付'].notna()]
+    if len(rows) == 0:
+        return summaries
+    names = rows['名前'].astype(str)
+    days = rows['日付'].dt.normalize()
+    sessions = days.groupby(names).nunique()
+    sets = names.value_counts()
+    volume = rows['総負荷量'].astype('float64').groupby([names, rows['Category'].astype('string').fillna('-')]).sum()
+    latest = (rows.assign(名前=names, 日=days).sort_values(['日付', 'set'], kind='stable')
+              .drop_duplicates(['名前', 'エクササイズ名'], keep='last').sort_values(['名前', 'エクササイズ名']))
+    for athlete, summary in summaries.items():
+        summary['sessions'] = int(sessions.get(athlete, 0))
+        summary['sets'] = int(sets.get(athlete, 0))
+        if athlete in volume.index.get_level_values(0):
+            summary['volume'] = {category: float(value) for category, value in volume[athlete].items() if value > 0}
+            summary['total'] = float(sum(summary['volume'].values()))
+    for athlete, exercise, day, load, reps in zip(latest['名前'], latest['エクササイズ名'], latest['日'], latest['負荷'], latest['回数']):
+        summaries[athlete]['latest'].append([
+            str(exercise), day.strftime('%Y/%m/%d'), '' if pd.isna(load) else str(load), '' if pd.isna(reps) else int(reps),
+        ])
+    return summaries
+
+# ---- PDFの描画（プロセスプールのワーカーでも呼ばれる） ----
+
+_font_registered = False
+
+def _styles():
+    global _font_registered
+    from reportlab.lib.styles import ParagraphStyle
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+    if not _font_registered:
+        pdfmetrics.registerFont(UnicodeCIDFont(REPORT_FONT))
+        _font_registered = True
+    return {
+        'title': ParagraphStyle('title', fontName=REPORT_FONT, fontSize=16, leading=22, spaceAfter=4),
+        'caption': ParagraphStyle('caption', fontName=REPORT_FONT, fontSize=9, leading=12, spaceAfter=10),
+        'heading': ParagraphStyle('heading', fontName=REPORT_FONT, fontSize=12, leading=16, spaceBefore=10, spaceAfter=6),
+        'body': ParagraphStyle('body', fontName=REPORT_FONT, fontSize=10, leading=14),
+    }
+
+def _table(rows, numeric_from=1):
+    from reportlab.lib import colors
+    from reportlab.platypus import Table, TableStyle
+    table = Table(rows, hAlign='LEFT', repeatRows=1)
+    table.setStyle(TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), REPORT_FONT),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#34495E')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('GRID', (0, 0), (-1, -1), 0.4, colors.HexColor('#BDC3C7')),
+        ('ALIGN', (numeric_from, 1), (-1, -1), 'RIGHT'),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F4F6F7')]),
+    ]))
+    return table
+
+def _build_pdf(title, caption, blocks):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate
+    styles = _styles()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, title=title, leftMargin=15 * mm, rightMargin=15 * mm, topMargin=15 * mm, bottomMargin=15 * mm)
+    story = [Paragraph(title, styles['title']), Paragraph(caption, styles['caption'])]
+    for heading, content in blocks:
+        story.append(Paragraph(heading, styles['heading']))
+        story.append(_table(content) if isinstance(content, list) else Paragraph(content, styles['body']))
+    doc.build(story)
+    return buffer.getvalue()
+
+def _kg(value):
+    return f"{value:,.0f}"
+
+def render_athlete_pdf(athlete, period, summary):
+    """選手1人分のレポート（セッション数・Category別総負荷量・種目ごとの直近の負荷）のPDF"""
+    total = summary['total']
+    categories = [category for category in CATEGORIES if category in summary['volume']]
+    categories += sorted(set(summary['volume']) - set(categories))
+    volume_rows = [['Category', '総負荷量 (kg)', '割合']] + [
+        [category, _kg(summary['volume'][category]), f"{summary['volume'][category] / total:.0%}" if total > 0 else '-']
+        for category in categories
+    ]
+    blocks = [
+        ('概要', [['セッション数', 'セット数', '総負荷量 (kg)'], [summary['sessions'], summary['sets'], _kg(total)]]),
+        ('Category別総負荷量', volume_rows if categories else '記録がありません'),
+        ('種目ごとの直近の負荷', [['エクササイズ', '日付', '負荷', '回数']] + summary['latest'] if summary['latest'] else '記録がありません'),
+    ]
+    return _build_pdf(f"{athlete} トレーニングレポート", f"期間: {period_label(period)}　作成: {datetime.now().strftime('%Y/%m/%d %H:%M')}", blocks)
+
+def render_team_pdf(team, period, summaries):
+    """チーム（U18/U15/Personal）のレポート（選手ごとのセッション数とCategory別総負荷量）のPDF"""
+    header = ['選手', 'セッション', *CATEGORIES, '合計']
+    rows = [
+        [athlete, summary['sessions'], *[_kg(summary['volume'].get(category, 0.0)) for category in CATEGORIES], _kg(summary['total'])]
+        for athlete, summary in sorted(summaries.items())
+    ]
+    totals = ['チーム合計', sum(summary['sessions'] for summary in summaries.values()),
+              *[_kg(sum(summary['volume'].get(category, 0.0) for summary in summaries.values())) for category in CATEGORIES],
+              _kg(sum(summary['total'] for summary in summaries.values()))]
+    blocks = [('選手別のセッション数と総負荷量 (kg)', [header] + rows + [totals] if rows else '記録がありません')]
+    caption = f"期間: {period_label(period)}　選手: {len(summaries)}名　作成: {datetime.now().strftime('%Y/%m/%d %H:%M')}"
+    return _build_pdf(f"{team} チームレポート", caption, blocks)
+
+def _render(job):
+    kind, args = job
+    return render_athlete_pdf(*args) if kind == 'athlete' else render_team_pdf(*args)
+
+class ReportCache:
+    """PDFレポートを (対象, 期間, データの版) ごとに保持する
+
+    集計は全員分をまとめてこのプロセスで行い、PDFの描画だけをプロセスプールに
+    分けて並列に行う（全員分でも数秒で終わる）。同じ対象・期間・版なら作成済みの
+    ファイルを返し、max_filesを超えたら古いものから消す。max_workers=1ならプールを
+    使わずこのプロセスで描く（プールが使えない環境でも同じ）。
+    """
+
+    def __init__(self, directory=None, max_files=200, max_workers=None):
+        self.directory = Path(directory or tempfile.mkdtemp(prefix="training_reports_"))
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_files = max_files
+        self.max_workers = max_workers or min(os.cpu_count() or 1, 4)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def path_for(self, subject, period, revision, extension='pdf'):
+        key = json.dumps([subject, period, revision], ensure_ascii=False, sort_keys=True, default=str)
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return self.directory / f"{digest}.{extension}"
+
+    def athlete_reports(self, df, athletes, period, revision):
+        """選手ごとのPDFのパス {選手: パス} を返す（無い分はまとめて作る）"""
+        with self._lock:
+            paths = self._athlete_reports(df, athletes, period, revision)
+            self._evict()
+        return paths
+
+    def team_report(self, df, team, athletes, period, revision):
+        with self._lock:
+            path = self._team_report(df, team, athletes, period, revision)
+            self._evict()
+        return path
+
+    def roster_archive(self, df, team, athletes, period, revision):
+        """チームのPDFと選手全員分のPDFをまとめたZIPのパスを返す"""
+        path = self.path_for(['roster', team, sorted(athletes)], period, revision, 'zip')
+        with self._lock:
+            if path.exists():
+                os.utime(path)
+                return path
+            paths = self._athlete_reports(df, athletes, period, revision)
+            team_path = self._team_report(df, team, athletes, period, revision)
+            tmp_path = path.with_suffix(path.suffix + '.tmp')
+            with zipfile.ZipFile(tmp_path, 'w') as archive:
+                archive.write(team_path, f"{team}_チーム.pdf")
+                for athlete, athlete_path in paths.items():
+                    archive.write(athlete_path, f"{team}_{athlete}.pdf")
+            os.replace(tmp_path, path)
+            self._evict()
+        return path
+
+    def _athlete_reports(self, df, athletes, period, revision):
+        paths = {athlete: self.path_for(['athlete', athlete], period, revision) for athlete in athletes}
+        missing = [athlete for athlete, path in paths.items() if not path.exists()]
+        for path in paths.values():
+            if path.exists():
+                os.utime(path)
+        if missing:
+            summaries = summarize_athletes(filter_training_log(df, *period, players=missing), missing)
+            jobs = [('athlete', (athlete, period, summaries[athlete])) for athlete in missing]
+            for athlete, pdf in zip(missing, self._render_all(jobs)):
+                self._write(paths[athlete], pdf)
+        return paths
+
+    def _team_report(self, df, team, athletes, period, revision):
+        path = self.path_for(['team', team, sorted(athletes)], period, revision)
+        if path.exists():
+            os.utime(path)
+            return path
+        summaries = summarize_athletes(filter_training_log(df, *period, players=athletes), athletes)
+        self._write(path, render_team_pdf(team, period, summaries))
+        return path
+
+    def _render_all(self, jobs):
+        if len(jobs) == 1 or self.max_workers == 1:
+            return [_render(job) for job in jobs]
+        try:
+            if self._pool is None:
+                # Streamlitのサーバーはスレッドを使うのでforkではなくspawnで起動する
+                self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+            return list(self._pool.map(_render, jobs, chunksize=max(len(jobs) // (self.max_workers * 4), 1)))
+        except (BrokenProcessPool, OSError):
+            # プールが壊れた・作れない場合はこのプロセスで描く（次回は作り直す）
+            self._pool = None
+            return [_render(job) for job in jobs]
+
+    def _write(self, path, data):
+        tmp_path = path.with_suffix(path.suffix + '.tmp')
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        files = sorted((p for p in self.directory.iterdir() if p.suffix != '.tmp'), key=lambda p: p.stat().st_mtime)
+        for old in files[:max(len(files) - self.max_files, 0)]:
+            old.unlink(missing_ok=True)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,336 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+# 再接続が必要なエラーの種類（認証切れ・通信エラー）
+_AUTH_ERROR_NAMES = {'RefreshError', 'TransportError', 'HttpAccessTokenRefreshError', 'AccessTokenRefreshError', 'ServerNotFoundError'}
+
+def is_api_error(error, status_code=None):
+    """gspreadのAPIError（status_codeを渡した場合はそのHTTPステータスのもの）ならTrue"""
+    # gspreadは読み込みに時間がかかるので、起動時には読まず使うときに読む
+    import gspread
+    if not isinstance(error, gspread.exceptions.APIError):
+        return False
+    return status_code is None or getattr(getattr(error, 'response', None), 'status_code', None) == status_code
+
+def is_connection_error(error):
+    """認証エラーや通信エラーならTrue（権限・データのエラーはFalse）"""
+    if is_api_error(error):
+        return is_api_error(error, 401)
+    if isinstance(error, (OSError, TimeoutError)):
+        return True
+    return type(error).__name__ in _AUTH_ERROR_NAMES
+
+def _client_credentials(client):
+    http_client = getattr(client, 'http_client', None)
+    return getattr(http_client, 'auth', None) or getattr(client, 'auth', None)
+
+def _expires_within(credentials, margin):
+    expiry = getattr(credentials, 'expiry', None) or getattr(credentials, 'token_expiry', None)
+    if expiry is None:
+        return False
+    if expiry.tzinfo is not None:
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return expiry - now < timedelta(seconds=margin)
+
+def _refresh_credentials(credentials):
+    if type(credentials).__module__.startswith('oauth2client'):
+        import httplib2
+        credentials.refresh(httplib2.Http())
+    else:
+        from google.auth.transport.requests import Request
+        credentials.refresh(Request())
+
+class SheetsHandlePool:
+    """SpreadsheetとWorksheetのハンドルを使い回すプール
+
+    open_by_urlとworksheet()の結果をキャッシュし、毎回のメタデータ取得を省く。
+    アクセストークンは期限切れ前に更新し、認証・通信エラーが起きたときだけ
+    クライアントを作り直して再接続する。
+    """
+
+    def __init__(self, get_client, spreadsheet_url, on_reconnect=None, refresh_margin=300):
+        self._get_client = get_client
+        self._spreadsheet_url = spreadsheet_url
+        self._on_reconnect = on_reconnect
+        self._refresh_margin = refresh_margin
+        self._lock = threading.RLock()
+        self._spreadsheet = None
+        self._worksheets = {}
+        self.counts = {'spreadsheet_hit': 0, 'spreadsheet_miss': 0, 'worksheet_hit': 0, 'worksheet_miss': 0, 'token_refresh': 0, 'reconnect': 0}
+
+    def client(self):
+        client = self._get_client()
+        if client is None:
+            return None
+        credentials = _client_credentials(client)
+        if credentials is not None and _expires_within(credentials, self._refresh_margin):
+            try:
+                _refresh_credentials(credentials)
+                self.counts['token_refresh'] += 1
+            except Exception:
+                # 更新に失敗した場合は次のAPI呼び出しのエラーで再接続する
+                pass
+        return client
+
+    def spreadsheet(self):
+        with self._lock:
+            client = self.client()
+            if client is None:
+                raise ConnectionError("Google Sheetsクライアントを作成できません")
+            if self._spreadsheet is not None:
+                self.counts['spreadsheet_hit'] += 1
+                return self._spreadsheet
+            self.counts['spreadsheet_miss'] += 1
+            self._spreadsheet = client.open_by_url(self._spreadsheet_url)
+            return self._spreadsheet
+
+    def worksheet(self, title):
+        """キャッシュ済みのWorksheetを返す（無ければgspread.WorksheetNotFound）"""
+        with self._lock:
+            if title in self._worksheets:
+                self.client()
+                self.counts['worksheet_hit'] += 1
+                return self._worksheets[title]
+            self.counts['worksheet_miss'] += 1
+            worksheet = self.spreadsheet().worksheet(title)
+            self._worksheets[title] = worksheet
+            return worksheet
+
+    def worksheet_titles(self):
+        """ワークシート名の一覧（取得したハンドルもキャッシュする）"""
+        with self._lock:
+            worksheets = self.spreadsheet().worksheets()
+            for worksheet in worksheets:
+                self._worksheets[worksheet.title] = worksheet
+            return [worksheet.title for worksheet in worksheets]
+
+    def delete_worksheet(self, title):
+        with self._lock:
+            self.spreadsheet().del_worksheet(self.worksheet(title))
+            self._worksheets.pop(title, None)
+
+    def add_worksheet(self, title, rows, cols):
+        with self._lock:
+            worksheet = self.spreadsheet().add_worksheet(title=title, rows=rows, cols=cols)
+            self._worksheets[title] = worksheet
+            return worksheet
+
+    def with_worksheet(self, title, func):
+        """func(worksheet)を実行し、接続エラーなら一度だけ再接続してやり直す
+
+        読み込みなど何度実行しても結果が変わらない処理だけに使うこと。
+        """
+        try:
+            return func(self.worksheet(title))
+        except Exception as e:
+            if not is_connection_error(e):
+                if getattr(getattr(e, 'response', None), 'status_code', None) in (400, 404):
+                    # シートが削除・改名された可能性があるのでハンドルだけ捨てる
+                    self.forget_worksheet(title)
+                raise
+            self.reconnect()
+            return func(self.worksheet(title))
+
+    def batch_values(self, titles):
+        """複数のワークシートの全セルを1回のvalues_batch_getで読む
+
+        {シート名: get_all_values()と同じ形（行の長さをそろえた文字列のリスト）} を返す。
+        接続エラーなら一度だけ再接続してやり直す。
+        """
+        if not titles:
+            return {}
+        ranges = ["'{}'".format(title.replace("'", "''")) for title in titles]
+        try:
+            response = self.spreadsheet().values_batch_get(ranges)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            self.reconnect()
+            response = self.spreadsheet().values_batch_get(ranges)
+        values = {}
+        for title, value_range in zip(titles, response.get('valueRanges', [])):
+            rows = value_range.get('values', [])
+            width = max((len(row) for row in rows), default=0)
+            values[title] = [list(row) + [''] * (width - len(row)) for row in rows]
+        return values
+
+    def reconnect(self):
+        with self._lock:
+            self._spreadsheet = None
+            self._worksheets = {}
+            self.counts['reconnect'] += 1
+            if self._on_reconnect is not None:
+                self._on_reconnect()
+
+    def forget_worksheet(self, title):
+        with self._lock:
+            self._worksheets.pop(title, None)
+
+# ---- APIクォータの管理 ----
+
+_READ_OPS = {
+    'open', 'open_by_url', 'open_by_key', 'worksheet', 'worksheets', 'get_worksheet', 'fetch_sheet_metadata',
+    'get', 'get_values', 'get_all_values', 'get_all_records', 'batch_get', 'row_values', 'col_values',
+    'acell', 'cell', 'values_get', 'values_batch_get', 'get_lastUpdateTime',
+}
+_WRITE_OPS = {
+    'append_row', 'append_rows', 'insert_row', 'insert_rows', 'update', 'update_cell', 'update_acell',
+    'batch_update', 'clear', 'delete_rows', 'add_worksheet', 'del_worksheet',
+    'values_append', 'values_update', 'values_batch_update', 'values_clear',
+}
+
+# 優先度ごとに残しておくトークンの割合（保存 > 画面表示 > バックグラウンド更新）
+PRIORITY_RESERVE = {'save': 0.0, 'interactive': 0.1, 'background': 0.3}
+
+class QuotaDeferred(Exception):
+    """クォータに余裕がないため、急がない読み込みを見送った"""
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self, reserve=0.0):
+        self._refill()
+        if self.tokens - 1 >= reserve:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self, reserve=0.0):
+        self._refill()
+        return max(reserve + 1 - self.tokens, 0) / self.rate
+
+    def drain(self):
+        self._refill()
+        self.tokens = 0.0
+
+class SheetsGovernor:
+    """読み込み・書き込みの1分あたりのクォータをトークンバケットで守る
+
+    書き込み（保存）はトークンを全て使えるが、画面表示の読み込みは1割、
+    バックグラウンド更新は3割を残す。バックグラウンド更新は余裕がなければ
+    待たずにQuotaDeferredで見送る。429を受けたらそのバケットを空にする。
+    """
+
+    def __init__(self, reads_per_minute=60, writes_per_minute=60, max_wait=10.0):
+        self.buckets = {'read': TokenBucket(reads_per_minute), 'write': TokenBucket(writes_per_minute)}
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.counts = {}
+        self.deferred = 0
+        self.waited_seconds = 0.0
+        self.quota_errors = 0
+
+    def current_priority(self):
+        return getattr(self._local, 'priority', 'interactive')
+
+    @contextmanager
+    def priority(self, priority):
+        """このスレッドで行うAPI呼び出しの優先度を一時的に変える"""
+        previous = self.current_priority()
+        self._local.priority = priority
+        try:
+            yield
+        finally:
+            self._local.priority = previous
+
+    def acquire(self, kind, operation):
+        priority = 'save' if kind == 'write' else self.current_priority()
+        bucket = self.buckets[kind]
+        reserve = bucket.capacity * PRIORITY_RESERVE[priority]
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            with self._lock:
+                if bucket.try_take(reserve):
+                    key = f"{kind}:{operation}"
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                    return
+                if priority == 'background':
+                    self.deferred += 1
+                    raise QuotaDeferred(f"{kind}クォータに余裕がないため{operation}を見送りました")
+                wait = min(bucket.wait_time(reserve), max(deadline - time.monotonic(), 0))
+            if wait <= 0:
+                # 待ちきれない場合はそのまま呼び出す（429なら呼び出し側で再試行される）
+                with self._lock:
+                    key = f"{kind}:{operation}"
+                    self.counts[key] = self.counts.get(key, 0) + 1
+                return
+            self.waited_seconds += wait
+            time.sleep(wait)
+
+    def note_quota_error(self, kind):
+        with self._lock:
+            self.quota_errors += 1
+            self.buckets[kind].drain()
+
+    def usage(self):
+        """種類ごとの呼び出し回数と残りトークン"""
+        with self._lock:
+            for bucket in self.buckets.values():
+                bucket._refill()
+            return {
+                'counts': dict(self.counts),
+                'tokens': {kind: int(bucket.tokens) for kind, bucket in self.buckets.items()},
+                'deferred': self.deferred,
+                'quota_errors': self.quota_errors,
+                'waited_seconds': self.waited_seconds,
+            }
+
+def _operation_kind(name):
+    if name in _WRITE_OPS:
+        return 'write'
+    if name in _READ_OPS:
+        return 'read'
+    return None
+
+def _is_sheets_handle(value):
+    return hasattr(value, 'append_rows') or hasattr(value, 'add_worksheet')
+
+class GovernedProxy:
+    """gspreadのClient/Spreadsheet/Worksheetを包み、API呼び出しごとにトークンを取る"""
+
+    def __init__(self, target, governor):
+        self._target = target
+        self._governor = governor
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        kind = _operation_kind(name)
+        if kind is None or not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self._governor.acquire(kind, name)
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception as e:
+                if is_api_error(e, 429):
+                    self._governor.note_quota_error(kind)
+                raise
+            return governed(result, self._governor)
+        return call
+
+    def __repr__(self):
+        return f"GovernedProxy({self._target!r})"
+
+def governed(value, governor):
+    """API呼び出しをgovernor経由にしたオブジェクトを返す"""
+    if governor is None or isinstance(value, GovernedProxy):
+        return value
+    if isinstance(value, list) and value and all(_is_sheets_handle(item) for item in value):
+        return [GovernedProxy(item, governor) for item in value]
+    if _is_sheets_handle(value) or hasattr(value, 'open_by_url'):
+        return GovernedProxy(value, governor)
+    return value
@@ -0,0 +1,65 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+import pyarrow as pa
+
+# スキーマのメタデータに保存時刻・版などを入れるキー
+_META_KEY = b'sunrockers_snapshot'
+
+class SnapshotStore:
+    """最後に読み込めたProgramsとTrainingLogをArrow IPCファイル（Feather v2）に保存する
+
+    起動直後やSheetsに届かない間はここから読んで表示する。非圧縮で書くので
+    読み込みはメモリマップで済み、ファイルの大きさによらずすぐに開ける。
+    書き込みは一時ファイルから置き換えるので、途中で落ちても前回の分が残る。
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._saved = {}
+
+    def path(self, name):
+        return self.directory / f"{name}.arrow"
+
+    def meta(self, name):
+        """保存時のメタデータ（無ければNone、データ部分は読まない）"""
+        try:
+            with pa.memory_map(str(self.path(name)), 'r') as source:
+                schema = pa.ipc.open_file(source).schema
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        raw = (schema.metadata or {}).get(_META_KEY)
+        return json.loads(raw) if raw else None
+
+    def load(self, name):
+        """(DataFrame, メタデータ) を返す（無い・壊れている場合はNone）"""
+        try:
+            with pa.memory_map(str(self.path(name)), 'r') as source:
+                table = pa.ipc.open_file(source).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None
+        raw = (table.schema.metadata or {}).get(_META_KEY)
+        return table.to_pandas(), json.loads(raw) if raw else {}
+
+    def save(self, name, df, version=None, min_interval=0, **meta):
+        """dfを保存する（versionが前回と同じ、または前回からmin_interval秒以内なら何もしない）"""
+        with self._lock:
+            last_version, last_saved = self._saved.get(name, (None, 0.0))
+            if version is not None and version == last_version:
+                return False
+            if time.time() - last_saved < min_interval:
+                return False
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            meta = dict(meta, saved_at=time.time(), version=version, rows=len(df))
+            table = table.replace_schema_metadata({**(table.schema.metadata or {}), _META_KEY: json.dumps(meta, ensure_ascii=False)})
+            path = self.path(name)
+            tmp_path = path.with_name(path.name + '.tmp')
+            with pa.OSFile(str(tmp_path), 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp_path, path)
+            self._saved[name] = (version, meta['saved_at'])
+            return True
@@ -0,0 +1,420 @@
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+from perf_trace import span
+
+TRAINING_LOG_COLUMNS = ["日付", "プログラム名", "名前", "体重", "エクササイズ名", "Category", "set", "負荷", "回数", "総負荷量"]
+
+# 負荷の書式: "60kg" / "60" / "70%" / "体重" / "体重+10kg"（それ以外は数値なし）
+_LOAD_PATTERN = r'^\s*(?:(?P<bw>体重)\s*(?:\+\s*(?P<extra>\d*\.?\d+)\s*(?:kg)?)?|(?P<num>\d*\.?\d+)\s*(?P<unit>kg|%)?)\s*$'
+
+def _unique_to_numeric(values):
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=False)
+    return pd.to_numeric(pd.Series(uniques), errors='coerce').to_numpy(dtype='float64')[codes]
+
+def parse_loads(loads, body_weights=None):
+    """負荷の列を (value, unit, bodyweight) のDataFrameに一括変換
+
+    valueは数値部分（体重の場合はbody_weightsの値で解決）、unitは'kg'/'%'/'体重'/''、
+    bodyweightは体重基準の負荷ならTrue。読み込み・保存・前回記録の全てでこれを使う。
+    """
+    loads = pd.Series(loads)
+    # ログの負荷は種類が少ないので、ユニークな文字列だけを正規表現で解析して展開する
+    codes, uniques = pd.factorize(loads.astype(str), use_na_sentinel=False)
+    parts = pd.Series(uniques).str.extract(_LOAD_PATTERN)
+    is_bodyweight = parts['bw'].notna().to_numpy()[codes]
+    value = pd.to_numeric(parts['num'], errors='coerce').to_numpy(dtype='float64')[codes]
+    unit = parts['unit'].fillna('').to_numpy(dtype=object)[codes]
+    unit[is_bodyweight] = '体重'
+    if body_weights is not None and is_bodyweight.any():
+        body_weights = body_weights.to_numpy() if isinstance(body_weights, pd.Series) else np.asarray(body_weights, dtype=object)
+        extra = pd.to_numeric(parts['extra'], errors='coerce').fillna(0).to_numpy()[codes]
+        value[is_bodyweight] = _unique_to_numeric(body_weights[is_bodyweight]) + extra[is_bodyweight]
+    return pd.DataFrame({'value': value, 'unit': unit, 'bodyweight': is_bodyweight}, index=loads.index)
+
+def load_in_kg(parsed):
+    """parse_loadsの結果からkg換算できる負荷だけを返す（%はNaN）"""
+    return parsed['value'].mask(parsed['unit'] == '%')
+
+# 型付け後のログの列の型（カテゴリ・小さい整数・float32で1行あたりのメモリを抑える）
+CATEGORY_COLUMNS = ['プログラム名', '名前', 'エクササイズ名', 'Category', '負荷', '負荷_単位']
+SMALL_INT_COLUMNS = {'set': 'Int8', '回数': 'Int16'}
+FLOAT32_COLUMNS = ['体重', '総負荷量', '負荷_数値']
+
+def _to_small_int(values, dtype):
+    """整数に変換（小数・範囲外・空欄は欠損）"""
+    numbers = pd.to_numeric(values, errors='coerce')
+    limits = np.iinfo(dtype.lower())
+    valid = numbers.notna() & (numbers == numbers.round()) & numbers.between(limits.min, limits.max)
+    return numbers.where(valid).astype(dtype)
+
+def make_log_rows(date, program_name, player_names, body_weights, exercise_names, categories, set_numbers, loads, reps):
+    """保存する行（TRAINING_LOG_COLUMNSの順の文字列）を作る
+
+    総負荷量はkg換算できる負荷×回数（%は0、体重は体重列の値で計算）。
+    """
+    body_weights = list(body_weights)
+    load_kg = load_in_kg(parse_loads(list(loads), body_weights)).fillna(0)
+    return [
+        [str(date), program_name, name, str(body_weight) if body_weight else '', exercise, category, str(set_number), str(load), str(rep), str(float(kg) * rep)]
+        for name, body_weight, exercise, category, set_number, load, rep, kg
+        in zip(player_names, body_weights, exercise_names, categories, set_numbers, loads, reps, load_kg)
+    ]
+
+def empty_training_log():
+    return type_training_log(pd.DataFrame(columns=TRAINING_LOG_COLUMNS))
+
+def type_training_log(df):
+    """シートから読んだ文字列のDataFrameを型付きに変換
+
+    日付はdatetime、set・回数は小さい整数（欠損可）、体重・総負荷量はfloat32、
+    名前などの繰り返しの多い文字列はカテゴリにする。負荷は元の文字列（カテゴリ）に
+    加えて、数値部分（負荷_数値）と単位（負荷_単位）を持つ。
+    """
+    # 負荷列の数値部分と単位を抽出（体重は体重列の値で解決するので、体重の変換より先に行う）
+    if '負荷' in df.columns:
+        parsed = parse_loads(df['負荷'], df['体重'] if '体重' in df.columns else None)
+        df['負荷_数値'] = parsed['value']
+        df['負荷_単位'] = parsed['unit']
+
+    if '日付' in df.columns:
+        df['日付'] = pd.to_datetime(df['日付'], errors='coerce')
+    for column, dtype in SMALL_INT_COLUMNS.items():
+        if column in df.columns:
+            df[column] = _to_small_int(df[column], dtype)
+    for column in FLOAT32_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float32')
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype('category')
+    return df
+
+def concat_training_logs(frames):
+    """型付きログを結合する（カテゴリ列はカテゴリをそろえてから結合し、型を保つ）"""
+    frames = [frame for frame in frames if len(frame) > 0]
+    if len(frames) == 0:
+        return empty_training_log()
+    if len(frames) == 1:
+        return frames[0]
+    frames = [frame.copy(deep=False) for frame in frames]
+    for column in CATEGORY_COLUMNS:
+        if not all(isinstance(frame[column].dtype, pd.CategoricalDtype) for frame in frames if column in frame.columns):
+            continue
+        categories = frames[0][column].cat.categories if column in frames[0].columns else pd.Index([])
+        for frame in frames[1:]:
+            if column in frame.columns:
+                categories = categories.append(frame[column].cat.categories.difference(categories))
+        for frame in frames:
+            if column in frame.columns:
+                frame[column] = frame[column].cat.set_categories(categories)
+    return pd.concat(frames, ignore_index=True)
+
+def memory_report(df):
+    """列ごとの型とメモリ使用量（バイト、文字列の中身を含む）"""
+    usage = df.memory_usage(index=False, deep=True)
+    report = pd.DataFrame({'型': df.dtypes.astype(str), 'バイト': usage})
+    report.index.name = '列'
+    return report.sort_values('バイト', ascending=False)
+
+LATEST_SESSION_KEYS = ['名前', 'エクササイズ名']
+
+def build_latest_session_index(df):
+    """(名前, エクササイズ名) → 最新日のセッション概要 の辞書を作る
+
+    概要: 日付、その日の総セット数、最終セット（set番号が最大の行）の
+    set・負荷・回数・総負荷量。総負荷量が空の行は負荷×回数で補う。
+    """
+    required = LATEST_SESSION_KEYS + ['日付', 'set', '負荷', '回数']
+    if len(df) == 0 or any(col not in df.columns for col in required):
+        return {}
+    dated = df[df['日付'].notna()]
+    if len(dated) == 0:
+        return {}
+    latest_date = dated.groupby(LATEST_SESSION_KEYS, sort=False, observed=True)['日付'].transform('max')
+    session = dated[dated['日付'] == latest_date]
+    set_counts = session.groupby(LATEST_SESSION_KEYS, sort=False, observed=True).size()
+
+    set_numbers = pd.to_numeric(session['set'], errors='coerce').astype('float64')
+    order = set_numbers.reset_index(drop=True).sort_values(kind='stable', na_position='first').index
+    last_sets = session.iloc[order].groupby(LATEST_SESSION_KEYS, sort=False, observed=True).tail(1)
+
+    totals = last_sets['総負荷量'] if '総負荷量' in last_sets.columns else pd.Series(float('nan'), index=last_sets.index)
+    if '負荷_数値' in last_sets.columns:
+        load_kg = last_sets['負荷_数値'].mask(last_sets['負荷_単位'] == '%') if '負荷_単位' in last_sets.columns else last_sets['負荷_数値']
+        totals = totals.fillna(load_kg * last_sets['回数'])
+
+    index = {}
+    for name, exercise, date, set_label, set_number, load, reps, total in zip(
+        last_sets['名前'], last_sets['エクササイズ名'], last_sets['日付'], last_sets['set'],
+        set_numbers.loc[last_sets.index], last_sets['負荷'], last_sets['回数'], totals
+    ):
+        index[(name, exercise)] = {
+            'date': date,
+            'total_sets': int(set_counts[(name, exercise)]),
+            'set': set_label,
+            'set_number': set_number,
+            'load': load,
+            'reps': reps,
+            'total_load': total,
+        }
+    return index
+
+def merge_latest_session_index(index, new_index):
+    """追記分から作った索引を既存の索引に反映する"""
+    for key, new in new_index.items():
+        old = index.get(key)
+        if old is None or new['date'] > old['date']:
+            index[key] = new
+        elif new['date'] == old['date']:
+            # 同じ日の追記: セット数を合算し、set番号が大きい方を最終セットとする
+            newer_set = pd.isna(old['set_number']) or new['set_number'] >= old['set_number']
+            merged = dict(new if newer_set else old)
+            merged['total_sets'] = old['total_sets'] + new['total_sets']
+            index[key] = merged
+    return index
+
+def log_metrics(df):
+    """データ管理ページの統計（総ログ数・選手数・最新日・カテゴリー数と内訳）"""
+    return {
+        'total_logs': len(df),
+        'players': df['名前'].nunique() if '名前' in df.columns else 0,
+        'latest_date': df['日付'].max() if '日付' in df.columns else None,
+        'categories': len([cat for cat in df['Category'].unique() if cat != '' and pd.notna(cat)]) if 'Category' in df.columns else 0,
+        'player_counts': _value_counts(df['名前']) if '名前' in df.columns else pd.Series(dtype=int),
+        'category_counts': _value_counts(df[df['Category'] != '']['Category']) if 'Category' in df.columns else pd.Series(dtype=int),
+    }
+
+def _value_counts(values):
+    # カテゴリ列のvalue_countsは出てこないカテゴリも0件で返すので除く
+    counts = values.value_counts()
+    return counts[counts > 0]
+
+def _add_counts(counts, values):
+    for key, count in values.items():
+        if count > 0:
+            counts[key] = counts.get(key, 0) + int(count)
+
+def _sorted_counts(counts, name):
+    series = pd.Series(counts, dtype='int64').sort_values(ascending=False, kind='stable')
+    series.index.name = name
+    return series.rename('count')
+
+class LogAggregates:
+    """データ管理ページの集計（選手別・カテゴリー別・プログラム別・日別の件数と最新日、選手ごとの実施プログラム）
+
+    TrainingLogSyncのリスナーとして、全件読み込みでは作り直し、追記では
+    追記分の件数だけを足し込む。metrics()の結果は次の更新まで使い回すので、
+    表示にかかる時間はログの行数に依存しない。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.total_logs = 0
+        self.player_counts = {}
+        self.category_counts = {}
+        self.day_counts = {}
+        self.program_counts = {}
+        self.player_programs = {}
+        self.latest_date = None
+        self._metrics = None
+
+    def on_log_change(self, kind, df):
+        with self._lock:
+            if kind == 'reset':
+                self._reset()
+            self.total_logs += len(df)
+            if '名前' in df.columns:
+                _add_counts(self.player_counts, df['名前'].value_counts())
+            if 'プログラム名' in df.columns:
+                _add_counts(self.program_counts, df.loc[df['プログラム名'] != '', 'プログラム名'].value_counts())
+                if '名前' in df.columns and len(df) > 0:
+                    for name, programs in df.groupby('名前', observed=True)['プログラム名'].unique().items():
+                        self.player_programs.setdefault(name, set()).update(programs)
+            if 'Category' in df.columns:
+                _add_counts(self.category_counts, df.loc[df['Category'] != '', 'Category'].value_counts())
+            if '日付' in df.columns:
+                dates = df['日付'].dropna()
+                if len(dates) > 0:
+                    _add_counts(self.day_counts, dates.dt.normalize().value_counts())
+                    latest = dates.max()
+                    if self.latest_date is None or latest > self.latest_date:
+                        self.latest_date = latest
+            self._metrics = None
+
+    def metrics(self):
+        """log_metricsと同じ形の統計を返す"""
+        with self._lock:
+            if self._metrics is None:
+                self._metrics = {
+                    'total_logs': self.total_logs,
+                    'players': len(self.player_counts),
+                    'latest_date': self.latest_date,
+                    'categories': len(self.category_counts),
+                    'player_counts': _sorted_counts(self.player_counts, '名前'),
+                    'category_counts': _sorted_counts(self.category_counts, 'Category'),
+                    'day_counts': _sorted_counts(self.day_counts, '日付').sort_index(),
+                    'program_counts': _sorted_counts(self.program_counts, 'プログラム名'),
+                    'player_programs': {name: set(programs) for name, programs in self.player_programs.items()},
+                }
+            return self._metrics
+
+def column_letter(n):
+    """列番号(1始まり)をA1表記の列名に変換"""
+    letters = ''
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _pad_row(row, width):
+    row = list(row)[:width]
+    return row + [''] * (width - len(row))
+
+def range_start_row(a1_range):
+    """'TrainingLog!A12:J13' のような範囲の開始行番号を返す"""
+    match = re.search(r'[A-Z]*(\d+)', str(a1_range).split('!')[-1]) if a1_range else None
+    return int(match.group(1)) if match else None
+
+def _strip_trailing(row):
+    row = list(row)
+    while row and row[-1] == '':
+        row.pop()
+    return row
+
+class TrainingLogSync:
+    """TrainingLogシートの追記分だけを取り込むリーダー
+
+    取り込み済みの行数を覚えておき、次回は新しい行の範囲だけを取得して
+    型付きDataFrameの末尾に追加する。ヘッダーが変わった場合や行が削除された
+    場合（最後に取り込んだ行が一致しない場合）だけ全件を読み直す。
+    返すDataFrameはセッション間で共有されるので、呼び出し側で変更しないこと。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.header = None
+        self.row_count = 0  # 取り込み済みのデータ行数（ヘッダーを除く）
+        self.last_row = None
+        self.df = empty_training_log()
+        self.last_sync = 0.0
+        self.full_reloads = 0
+        self.incremental_reads = 0
+        self.latest_index = {}
+        # 取り込んだデータの版（全件読み込み・追記のたびに増える）
+        self.revision = 0
+        # 全件読み込み('reset')・追記('append')のたびに (kind, df) で呼ばれる
+        self.listeners = []
+        self.listener_error = None
+
+    def is_fresh(self, max_age):
+        return self.header is not None and time.time() - self.last_sync < max_age
+
+    def mark_stale(self):
+        self.last_sync = 0.0
+
+    def latest_session(self, player_name, exercise_name):
+        """前回のトレーニング概要を返す（記録が無ければNone）"""
+        return self.latest_index.get((player_name, exercise_name))
+
+    def refresh(self, worksheet):
+        with self._lock:
+            if self.header is None:
+                self._full_reload(worksheet)
+            else:
+                self._read_appended(worksheet)
+            self.last_sync = time.time()
+            return self.df
+
+    def load_values(self, data):
+        """別の経路（起動時の一括読み込み）で読んだシートの値で全件を置き換える
+
+        dataはget_all_values()と同じ形（1行目がヘッダー）。
+        """
+        with self._lock:
+            self._load_values(data)
+            self.last_sync = time.time()
+            return self.df
+
+    def _full_reload(self, worksheet):
+        with span('sheet_fetch'):
+            data = worksheet.get_all_values()
+        self._load_values(data)
+
+    def _load_values(self, data):
+        self.full_reloads += 1
+        self.header = list(data[0]) if len(data) > 0 else None
+        self.row_count = max(len(data) - 1, 0)
+        self.last_row = list(data[-1]) if len(data) > 1 else None
+        with span('parse'):
+            if len(data) > 1:
+                # 1行目をヘッダーとして使用し、2行目以降をデータとして使用
+                self.df = type_training_log(pd.DataFrame(data[1:], columns=data[0]))
+            else:
+                self.df = empty_training_log()
+            self.latest_index = build_latest_session_index(self.df)
+        self._notify('reset', self.df)
+
+    def _read_appended(self, worksheet):
+        width = len(self.header)
+        last_col = column_letter(width)
+        # 最後に取り込んだ行から取得し、先頭行で削除・並べ替えがないか確認する
+        start_row = self.row_count + 1 if self.row_count > 0 else 2
+        with span('sheet_fetch'):
+            header_range, tail_range = worksheet.batch_get(["1:1", f"A{start_row}:{last_col}"])
+        self.incremental_reads += 1
+
+        header = header_range[0] if len(header_range) > 0 else []
+        if _strip_trailing(header) != _strip_trailing(self.header):
+            self._full_reload(worksheet)
+            return
+
+        tail = [_pad_row(row, width) for row in tail_range]
+        if self.row_count > 0:
+            if len(tail) == 0 or tail[0] != _pad_row(self.last_row, width):
+                self._full_reload(worksheet)
+                return
+            tail = tail[1:]
+        if len(tail) > 0:
+            self._append_rows(tail)
+
+    def merge_written(self, rows, updated_range=None):
+        """保存した行をキャッシュに直接反映する（ライトスルー）
+
+        append_rowsの応答の書き込み範囲が取り込み済みの直後から始まる場合だけ
+        反映する。他の書き込みが間に入っていた場合は次回の差分読み込みに任せる。
+        """
+        with self._lock:
+            if self.header is None or range_start_row(updated_range) != self.row_count + 2:
+                self.mark_stale()
+                return False
+            width = len(self.header)
+            self._append_rows([_pad_row([str(v) for v in row], width) for row in rows])
+            return True
+
+    def _append_rows(self, rows):
+        with span('parse'):
+            new_df = type_training_log(pd.DataFrame(rows, columns=self.header))
+            # 索引は新しい辞書に作り直してから差し替える（読み込み中のセッションに影響させない）
+            self.latest_index = merge_latest_session_index(dict(self.latest_index), build_latest_session_index(new_df))
+            if self.row_count == 0:
+                self.df = new_df
+            else:
+                self.df = concat_training_logs([self.df, new_df])
+        self.row_count += len(rows)
+        self.last_row = rows[-1]
+        self._notify('append', new_df)
+
+    def _notify(self, kind, df):
+        self.revision += 1
+        for listener in self.listeners:
+            try:
+                listener(kind, df)
+            except Exception as e:
+                # リスナー側の失敗でログの読み込み自体は止めない
+                self.listener_error = f"{type(e).__name__}: {str(e)[:80]}"
@@ -0,0 +1,255 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from sheets_client import is_api_error
+
+def is_quota_error(error):
+    return is_api_error(error, 429)
+
+def is_permanent_error(error):
+    """送り直しても通らないAPIエラー（不正な値・権限・存在しないシート）ならTrue"""
+    if is_api_error(error, 403):
+        # 403でも利用上限のものは時間をおけば通る
+        return 'ratelimit' not in str(error).lower().replace(' ', '')
+    return is_api_error(error, 400) or is_api_error(error, 404)
+
+class TrainingLogWriter:
+    """TrainingLogへの書き込みをまとめて行うバックグラウンドライター
+
+    保存要求はまずSQLiteのスプールに記録してすぐに返し、書き込みスレッドが
+    flush_intervalごとに全セッションの未送信行を書き込み先ごとに1回のappend_rowsで
+    送る。書き込み先のワークシート名はroute(row)で決め、get_worksheet(title)で
+    取得する。失敗した場合は指数バックオフ（429は長め）で再送する。プロセスが
+    落ちてもスプールに残った行は次回起動時に送られる。1回のsubmitで積んだ行は
+    max_batch_rowsを超えても分けずに同じappend_rowsで送る。
+    同じスプールを複数のプロセスで共有してもよいように、送る行は1つのトランザクションで
+    自分のものにしてから送る（claim_timeout秒を過ぎても送信済みにならない行は、
+    送信中に落ちたとみなして他のライターが引き取る）。
+    400・403などの送り直しても通らないエラーは、保存（submit）ごとに送り直して
+    通らなかったものだけを'failed'にし、後ろの保存を止めない。
+    """
+
+    def __init__(self, spool_path, get_worksheet, route=None, on_written=None, on_error=None, flush_interval=1.0, max_batch_rows=500, max_backoff=60.0, claim_timeout=300.0):
+        self._spool_path = spool_path
+        self._get_worksheet = get_worksheet
+        self._route = route or (lambda row: "TrainingLog")
+        self._on_written = on_written
+        self._on_error = on_error
+        self.flush_interval = flush_interval
+        self.max_batch_rows = max_batch_rows
+        self.max_backoff = max_backoff
+        self.claim_timeout = claim_timeout
+        self._owner = uuid.uuid4().hex
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._failures = 0
+        self._retry_at = 0.0
+        self.last_error = None
+        self.callback_error = None
+        self.flush_count = 0
+        self._db = sqlite3.connect(spool_path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                created_at REAL NOT NULL,
+                acked_at REAL
+            )""")
+        columns = {column[1] for column in self._db.execute("PRAGMA table_info(spool)")}
+        for column, column_type in [('batch_id', 'TEXT'), ('owner', 'TEXT'), ('claimed_at', 'REAL'), ('error', 'TEXT')]:
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE spool ADD COLUMN {column} {column_type}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS spool_status ON spool (status, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS spool_session ON spool (session_id, status)")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="training-log-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self, flush=True):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        if flush:
+            self.flush()
+
+    def submit(self, session_id, rows):
+        """行をスプールに積んで件数を返す（送信は書き込みスレッドが行う）"""
+        now = time.time()
+        batch_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany(
+                    "INSERT INTO spool (session_id, row_json, created_at, batch_id) VALUES (?, ?, ?, ?)",
+                    [(session_id, json.dumps([str(value) for value in row], ensure_ascii=False), now, batch_id) for row in rows],
+                )
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        self._wakeup.set()
+        return len(rows)
+
+    def status(self, session_id):
+        """セッションの送信待ち・送信済み・送信失敗の行数と直近のエラー"""
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT status, COUNT(*) FROM spool WHERE session_id = ? GROUP BY status", (session_id,)
+            ).fetchall())
+            failed_error = self._db.execute(
+                "SELECT error FROM spool WHERE session_id = ? AND status = 'failed' ORDER BY id DESC LIMIT 1", (session_id,)
+            ).fetchone() if counts.get('failed') else None
+        pending = counts.get('pending', 0) + counts.get('sending', 0)
+        return {
+            'pending': pending,
+            'acked': counts.get('acked', 0),
+            'failed': counts.get('failed', 0),
+            'failed_error': failed_error[0] if failed_error else None,
+            'last_error': self.last_error if pending else None,
+        }
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM spool WHERE status IN ('pending', 'sending')").fetchone()[0]
+
+    def flush(self):
+        """未送信行を書き込み先ごとに1回のappend_rowsで送る。送った行数を返す（失敗時は例外）"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _claim(self):
+        """送る行を1つのトランザクションで自分のものにして返す（他のプロセスと同じ行を送らない）"""
+        now = time.time()
+        sendable = "(status = 'pending' OR (status = 'sending' AND claimed_at < ?))"
+        with self._lock:
+            # 書き込みロックを先に取り、選んでから印を付けるまでに他のプロセスが割り込まないようにする
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                pending = self._db.execute(
+                    f"SELECT id, row_json, batch_id FROM spool WHERE {sendable} ORDER BY id LIMIT ?", (now - self.claim_timeout, self.max_batch_rows)
+                ).fetchall()
+                if len(pending) == self.max_batch_rows and pending[-1][2] is not None:
+                    # 上限で切れた保存の残りも同じ送信に含める
+                    pending += self._db.execute(
+                        f"SELECT id, row_json, batch_id FROM spool WHERE {sendable} AND batch_id = ? AND id > ? ORDER BY id",
+                        (now - self.claim_timeout, pending[-1][2], pending[-1][0]),
+                    ).fetchall()
+                self._db.executemany(
+                    "UPDATE spool SET status = 'sending', owner = ?, claimed_at = ? WHERE id = ?",
+                    [(self._owner, now, spool_id) for spool_id, _, _ in pending],
+                )
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return pending
+
+    def _release(self, ids):
+        # 送れなかった行は未送信に戻す（このプロセスでも他のプロセスでも再送できる）
+        with self._lock:
+            self._db.executemany(
+                "UPDATE spool SET status = 'pending', owner = NULL, claimed_at = NULL WHERE id = ? AND status = 'sending' AND owner = ?",
+                [(spool_id, self._owner) for spool_id in ids],
+            )
+
+    def _flush(self):
+        pending = self._claim()
+        if not pending:
+            return 0
+        # 書き込み先ごとにまとめ、最初に出てきた順に送る
+        batches = {}
+        for spool_id, row_json, batch_id in pending:
+            row = json.loads(row_json)
+            batches.setdefault(self._route(row), []).append((spool_id, row, batch_id))
+        sent = 0
+        try:
+            for title, entries in batches.items():
+                try:
+                    sent += self._append(title, entries)
+                except Exception as e:
+                    if not is_permanent_error(e):
+                        raise
+                    # どの保存が原因か分からないので、保存ごとに送り直して通らないものだけ止める
+                    submits = {}
+                    for entry in entries:
+                        submits.setdefault(entry[2] or entry[0], []).append(entry)
+                    for submit_entries in submits.values():
+                        try:
+                            sent += self._append(title, submit_entries)
+                        except Exception as submit_error:
+                            if not is_permanent_error(submit_error):
+                                raise
+                            self._park(submit_entries, submit_error)
+        except Exception:
+            # 送れなかった行は未送信に戻す（送信済み・失敗にした行はそのまま）
+            self._release([spool_id for spool_id, _, _ in pending])
+            raise
+        self.flush_count += 1
+        return sent
+
+    def _append(self, title, entries):
+        ids = [spool_id for spool_id, _, _ in entries]
+        rows = [row for _, row, _ in entries]
+        response = self._get_worksheet(title).append_rows(rows)
+        now = time.time()
+        with self._lock:
+            self._db.executemany("UPDATE spool SET status = 'acked', acked_at = ? WHERE id = ?", [(now, spool_id) for spool_id in ids])
+            # 送信済みの記録は1時間で消す
+            self._db.execute("DELETE FROM spool WHERE status = 'acked' AND acked_at < ?", (now - 3600,))
+        if self._on_written is not None:
+            updated_range = response.get('updates', {}).get('updatedRange') if isinstance(response, dict) else None
+            try:
+                self._on_written(title, rows, updated_range)
+            except Exception as e:
+                # 書き込みは済んでいるので、読み込み側の反映に失敗しても送信は続ける
+                self.callback_error = f"{type(e).__name__}: {str(e)[:80]}"
+        return len(rows)
+
+    def _park(self, entries, error):
+        # 送り直しても通らない行は'failed'にして残す（画面に出し、後ろの保存は止めない）
+        message = f"{type(error).__name__}: {str(error)[:80]}"
+        with self._lock:
+            self._db.executemany(
+                "UPDATE spool SET status = 'failed', error = ?, owner = NULL, claimed_at = NULL WHERE id = ?",
+                [(message, spool_id) for spool_id, _, _ in entries],
+            )
+
+    def _backoff(self, error):
+        base = 5.0 if is_quota_error(error) else 1.0
+        delay = min(base * (2 ** (self._failures - 1)), self.max_backoff)
+        return delay * random.uniform(0.8, 1.2)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # 保存が続いた場合も少し待って同じウィンドウの行をまとめる
+            time.sleep(min(self.flush_interval, 0.2))
+            if self._stop.is_set() or time.time() < self._retry_at:
+                continue
+            try:
+                while self.flush() >= self.max_batch_rows:
+                    pass
+                self._failures = 0
+                self.last_error = None
+            except Exception as e:
+                self._failures += 1
+                self.last_error = f"{type(e).__name__}: {str(e)[:80]}"
+                self._retry_at = time.time() + self._backoff(e)
+                if self._on_error is not None:
+                    self._on_error(e)